@@ -5,9 +5,10 @@ import os
 import re
 import json
 import importlib.util
-import glob
 import datetime
 import shutil
+import stat
+import tempfile
 import traceback
 import unicodedata
 import select
@@ -18,6 +19,12 @@ import urllib.request
 import platform
 import csv
 import io
+import codecs
+import copy
+import bisect
+import heapq
+from collections import OrderedDict, deque
+from itertools import accumulate
 
 # --- 定数定義 (Key Codes) ---
 CTRL_A = 1
@@ -58,17 +65,43 @@ try:
 except ImportError:
     HAS_PTY = False
 
+# 任意: watchdog があれば開いているファイルの外部変更を inotify / kqueue などで受け取る
+try:
+    from watchdog.observers import Observer
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+# 任意: google-re2 があれば検索を線形時間の RE2 で行う（非対応の構文は re にフォールバック）
+try:
+    import re2
+    HAS_RE2 = True
+except ImportError:
+    HAS_RE2 = False
+
+# 任意: numpy があれば大きなファイルを行オフセットの索引だけで開く
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # --- デフォルト設定 ---
 EDITOR_NAME = "CAFFEE"
 VERSION = "2.10.2"
 DEFAULT_CONFIG = {
     "tab_width": 4,
     "history_limit": 50,
+    "history_bytes_limit": 524288, # undo 履歴が保持する行データの上限（バイト）
     "use_soft_tabs": True,
     "auto_indent": True,
     "backup_subdir": "backup",
     "backup_count": 5,
     "enable_predictive_text": True, # 予測変換を有効にするか
+    "hl_max_lines": 5000, # これより行数の多いファイルはハイライトしない
+    "hl_max_line_len": 16384, # これより長い行はハイライトしない
+    "file_check_interval": 2, # 開いているファイルが外部で変更されたかを確認する間隔（秒）
+    "lazy_load_threshold": 1048576, # これ以上のサイズのファイルは行を必要な時だけデコードする (numpy が必要)
     # --- Splash / Start Screen Settings ---
     "show_splash": True,         # スプラッシュ画面を表示するか
     "splash_duration": 500,     # 自動遷移する場合の表示時間(ms)
@@ -454,7 +487,9 @@ DEFAULT_SYNTAX_RULES = {
         "keywords": r"(^#+\s+.*)|(^\s*[\-\*+]\s+)",
         "comments": r"^>.*",
         "strings": r"(`[^`]+`|\*\*.*?\*\*)",
-        "numbers": r"\[.*?\]"
+        "numbers": r"\[.*?\]",
+        # 見出しの中の強調のように分類どうしが入れ子になるので、順に上書きして塗る
+        "layered": True
     },
     "diff": {
         "extensions": [],
@@ -577,6 +612,115 @@ DEFAULT_SYNTAX_RULES = {
     }
 }
 
+# ハイライトに使うパターンのキー（適用順）
+_HL_KEYS = ("keywords", "numbers", "strings", "comments")
+# ハイライト属性コード（= カラーペア番号）。bytearray にそのまま格納する
+HL_KEYWORD, HL_STRING, HL_COMMENT, HL_NUMBER = 5, 6, 7, 8
+_HL_CODES = {"keywords": HL_KEYWORD, "numbers": HL_NUMBER, "strings": HL_STRING, "comments": HL_COMMENT}
+# 結合パターンでの優先順（先に書いたものが同じ位置で勝つ）とグループ名
+# グループ名はプラグインのパターン内の名前付きグループと衝突しにくいものにする
+_HL_COMBINE_ORDER = (("comments", "_hl_com"), ("strings", "_hl_str"), ("numbers", "_hl_num"), ("keywords", "_hl_kw"))
+_HL_GROUP_CODES = {"_hl_com": bytes([HL_COMMENT]), "_hl_str": bytes([HL_STRING]),
+                   "_hl_num": bytes([HL_NUMBER]), "_hl_kw": bytes([HL_KEYWORD])}
+_BACKREF_RE = re.compile(r'\\(\d+|.)', re.DOTALL)
+# 先頭のグローバルなインラインフラグ (?i) など。結合すると途中に来てエラーになる
+_GLOBAL_FLAGS_RE = re.compile(r'\(\?([aiLmsux]+)\)')
+
+def _shift_backrefs(pattern, offset):
+    """パターン中の数値後方参照 (\\1 など) を offset だけずらす"""
+    if not offset: return pattern
+    def repl(m):
+        ref = m.group(1)
+        # \\0 や3桁の8進エスケープは後方参照ではない
+        if not ref.isdigit() or ref[0] == '0' or len(ref) >= 3: return m.group(0)
+        return '\\' + str(int(ref) + offset)
+    return _BACKREF_RE.sub(repl, pattern)
+
+def _build_combined(compiled):
+    """コメント|文字列|数値|キーワード を1本の正規表現にまとめる。失敗したら None"""
+    parts = []
+    group_count = 0
+    for key, name in _HL_COMBINE_ORDER:
+        pat = compiled[key]
+        if pat is None: continue
+        group_count += 1  # 名前付きグループ自身
+        src = _shift_backrefs(pat.pattern, group_count)
+        m = _GLOBAL_FLAGS_RE.match(src)
+        if m:
+            # (?i)xxx -> (?i:xxx) としてそのパターンの中だけに効かせる
+            src = f"(?{m.group(1)}:{src[m.end():]})"
+        parts.append(f"(?P<{name}>{src})")
+        group_count += pat.groups
+    if not parts: return None
+    try:
+        return re.compile("|".join(parts))
+    except re.error:
+        return None
+
+def _compile_rules(rules):
+    """シンタックスルールのパターンをコンパイルして rules["_compiled"] にキャッシュする。
+    元の文字列はそのまま残すので、プラグインからの参照・書き換えにも追従する。"""
+    sources = tuple(rules.get(k) for k in _HL_KEYS) + (bool(rules.get("layered")),)
+    cached = rules.get("_compiled")
+    if cached and cached[0] == sources:
+        return cached[1]
+    compiled = {}
+    for key, pat in zip(_HL_KEYS, sources):
+        try:
+            compiled[key] = re.compile(pat) if pat else None
+        except (re.error, TypeError):
+            compiled[key] = None
+    # layered なルールは分類ごとに順に上書きする（1本の正規表現では入れ子を塗れない）
+    compiled["_combined"] = None if sources[-1] else _build_combined(compiled)
+    rules["_compiled"] = (sources, compiled)
+    return compiled
+
+# マクロの式として eval してよい文字だけからなるか
+_MACRO_EXPR_RE = re.compile(r'^[0-9\s\+\-\*\/\(\)\%\>\<\=\!\&\|\.]+$')
+
+# 保存時に一度に連結して書き出す行数
+_SAVE_CHUNK_LINES = 4096
+# 選択範囲の (行, 桁) を1つの整数 (行 << _SEL_COL_BITS) + 桁 にまとめる時の桁のビット数
+_SEL_COL_BITS = 32
+# 同じ行への連続した文字入力を1つの undo にまとめる間隔（秒）
+_TYPING_UNDO_MERGE = 0.5
+
+# 検索クエリがこれらを含まなければリテラル検索とみなせる
+_REGEX_META = frozenset('.^$*+?{}[]\\|()\n')
+
+# 入力用: get_wch が文字列で返すキーのうち、キーコードとして扱う制御文字
+_CONTROL_CHARS = frozenset(map(chr, [*range(32), 127]))
+
+# 描画用: 制御文字はそのまま出すと curses が展開してしまうので1セルの文字に置き換える
+_CTRL_CHARS_RE = re.compile('[\x00-\x1f\x7f]')
+_CTRL_DISPLAY = {c: '^' for c in list(range(32)) + [127]}
+_CTRL_DISPLAY[ord('\t')] = ' '
+# 全角スペースの連続
+_ZEN_FINDER = re.compile('\u3000+')
+# 同じ属性コードが続く区間
+_ATTR_RUN_RE = re.compile(rb'(.)\1*', re.DOTALL)
+
+def _highlight_line(compiled, line, attrs):
+    """1行分のハイライトコードを bytearray attrs に書き込む"""
+    combined = compiled["_combined"]
+    if combined is not None:
+        codes = _HL_GROUP_CODES
+        for m in combined.finditer(line):
+            s, e = m.span()
+            if s != e: attrs[s:e] = codes[m.lastgroup] * (e - s)
+        return
+    # layered なルールや結合できなかった場合（プラグインのパターンが名前衝突した等）は従来通り順に上書き
+    for key in _HL_KEYS:
+        pat = compiled[key]
+        if pat is None: continue
+        code = bytes([_HL_CODES[key]])
+        for m in pat.finditer(line):
+            s, e = m.span()
+            if s != e: attrs[s:e] = code * (e - s)
+
+for _rules in DEFAULT_SYNTAX_RULES.values():
+    _compile_rules(_rules)
+
 DEFAULT_BUILD_COMMANDS = {
     ".py": "python3 \"{filename}\"",
     ".js": "node \"{filename}\"",
@@ -608,6 +752,9 @@ def get_config_dir():
     home_dir = os.path.expanduser("~")
     return os.path.join(home_dir, ".caffee_setting")
 
+# setting.json の解析結果（(st_mtime_ns, st_size), 設定）。ファイルが変わっていなければ解析し直さない
+_CONFIG_CACHE = [None, None]
+
 def load_config():
     """ユーザー設定ファイル(setting.json)を読み込む"""
     setting_dir = get_config_dir()
@@ -620,11 +767,21 @@ def load_config():
     except OSError as e:
         load_error = f"Config dir error: {e}"
 
-    if os.path.exists(setting_file):
+    try:
+        st = os.stat(setting_file)
+    except OSError:
+        st = None
+    if st is not None:
+        key = (st.st_mtime_ns, st.st_size)
+        if _CONFIG_CACHE[0] == key:
+            # 呼び出し側が書き換えても共有しないようコピーを返す
+            return copy.deepcopy(_CONFIG_CACHE[1]), load_error
         try:
-            with open(setting_file, 'r', encoding='utf-8') as f:
-                user_config = json.load(f)
-        except (json.JSONDecodeError, OSError) as e:
+            # ファイルオブジェクト経由ではなく、まとめて読んだバイト列を解析する
+            with open(setting_file, 'rb') as f:
+                user_config = json.loads(f.read().decode('utf-8'))
+            _CONFIG_CACHE[:] = [key, copy.deepcopy(user_config)]
+        except (json.JSONDecodeError, UnicodeDecodeError, OSError) as e:
             load_error = f"Config load error: {e}"
             
     return user_config, load_error
@@ -649,11 +806,73 @@ ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 def strip_ansi(text):
     return ANSI_ESCAPE.sub('', text)
 
+# 短い行（空行・インデントのみの行など）は同じ内容が大量に現れるので共有する
+_INTERN_MAX_LEN = 16
+
+def _intern_lines(lines):
+    """短いASCII行を sys.intern で共有したリストを返す（長い行はそのまま）"""
+    intern = sys.intern
+    return [intern(l) if len(l) <= _INTERN_MAX_LEN and l.isascii() else l for l in lines]
+
+def _scan_py_files(directory):
+    """directory 直下の *.py ファイルを (名前, パス) のリストで返す（glob と同じく隠しファイルは除く）。
+    os.scandir の1回の走査で済ませる"""
+    try:
+        with os.scandir(directory) as it:
+            return [(e.name, e.path) for e in it
+                    if e.name.endswith(".py") and not e.name.startswith(".") and e.is_file()]
+    except OSError:
+        return []
+
+def _read_text_lines(path):
+    """UTF-8 のテキストファイルを行のリストとして読む。
+    テキストモードの改行変換を通さず、まとめて読んで一度にデコードする
+    （splitlines() が \r\n / \r も改行として扱うので結果は同じ）"""
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8').splitlines()
+
+def _patch_size(record):
+    """undo 履歴の差分 1件が保持する行データのおおよそのバイト数"""
+    getsizeof = sys.getsizeof
+    return sum(map(getsizeof, record[1])) + sum(map(getsizeof, record[2]))
+
+def _intern_line(line):
+    """1行分の _intern_lines（行を分割・結合した直後に使う）"""
+    if len(line) <= _INTERN_MAX_LEN and line.isascii():
+        return sys.intern(line)
+    return line
+
+def _clone_file(src, dst):
+    """src を dst にコピーする（メタデータ込み）。
+    copy_file_range が使えればカーネル内で複製し、btrfs/XFS などでは reflink になる。"""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if n == 0: break
+                    remaining -= n
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            pass  # EXDEV / ENOSYS / EINVAL など: 通常のコピーにする
+    shutil.copy2(src, dst)
+
+# BMP の文字幅のメモ (0 = 未計算, 1 = 半角, 2 = 全角)。一度調べた文字は表を引くだけにする
+_WIDTH_TABLE = bytearray(0x10000)
+
 def get_char_width(char):
     """文字の表示幅を返す（半角=1, 全角=2）"""
+    o = ord(char)
+    if o < 0x10000:
+        w = _WIDTH_TABLE[o]
+        if w: return w
     # 'A' (Ambiguous) characters like box drawings are often 1 in modern terminals.
     # Treating them as 2 can cause broken frames with gaps.
-    return 2 if unicodedata.east_asian_width(char) in ('F', 'W') else 1
+    w = 2 if unicodedata.east_asian_width(char) in ('F', 'W') else 1
+    if o < 0x10000: _WIDTH_TABLE[o] = w
+    return w
 
 def get_string_display_width(s):
     """文字列の合計表示幅を計算する"""
@@ -792,7 +1011,112 @@ class Buffer:
         self.lines = lines
     
     def clone(self):
-        return Buffer([line for line in self.lines])
+        # str は不変なのでリストの浅いコピーで十分
+        return Buffer(self.lines[:])
+
+    def max_line_len(self):
+        """最も長い行の文字数"""
+        return max(map(len, self.lines), default=0)
+
+class IndexedBuffer(Buffer):
+    """大きなファイル用のバッファ。
+    行の開始・終了オフセットだけを numpy 配列で持ち、表示する行をその都度デコードする。
+    lines に触れた時点（編集・保存・全文検索など）で通常のリストに展開する。"""
+    # str.splitlines() が \n 以外に改行とみなすもの（含まれていれば通常の読み込みにする）
+    _OTHER_BREAKS = (b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e',
+                     b'\xc2\x85', b'\xe2\x80\xa8', b'\xe2\x80\xa9')
+    _VALIDATE_CHUNK = 1 << 20
+
+    def __init__(self, data, starts, ends):
+        self._data = data
+        self._starts = starts
+        self._ends = ends
+        self._lines = None
+
+    @classmethod
+    def from_bytes(cls, data):
+        """UTF-8 のバイト列から索引を作る。索引で表せない内容なら None を返す。
+        不正な UTF-8 は UnicodeDecodeError を送出する。"""
+        if not data or any(b in data for b in cls._OTHER_BREAKS):
+            return None
+        cr_count = data.count(b'\r')
+        if cr_count and cr_count != data.count(b'\r\n'):
+            return None
+        arr = np.frombuffer(data, dtype=np.uint8)
+        if (arr >= 0x80).any():
+            # デコード結果は捨て、妥当性だけを確かめる
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            step = cls._VALIDATE_CHUNK
+            for i in range(0, len(data), step):
+                decoder.decode(data[i:i + step], i + step >= len(data))
+        nl = np.flatnonzero(arr == 0x0A)
+        line_ends = nl
+        if cr_count:
+            line_ends = nl - (arr[nl - 1] == 0x0D)
+        starts = np.concatenate(([0], nl + 1))
+        ends = np.concatenate((line_ends, [len(data)]))
+        if data.endswith(b'\n'):
+            # splitlines() と同じく末尾の改行の後ろに空行は作らない
+            starts = starts[:-1]
+            ends = ends[:-1]
+        return cls(data, starts, ends)
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = _intern_lines(self._data.decode('utf-8').splitlines()) or [""]
+            self._data = self._starts = self._ends = None
+        return self._lines
+
+    @lines.setter
+    def lines(self, value):
+        self._lines = value
+        self._data = self._starts = self._ends = None
+
+    def __len__(self):
+        if self._lines is not None:
+            return len(self._lines)
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if self._lines is not None or isinstance(index, slice):
+            return self.lines[index]
+        return self._data[self._starts[index]:self._ends[index]].decode('utf-8')
+
+    # 大文字小文字を無視すると ASCII の i / k / s に一致する非 ASCII 文字 (İ ı K ſ)
+    _ASCII_FOLD_EXTRA = (b'\xc4\xb0', b'\xc4\xb1', b'\xe2\x84\xaa', b'\xc5\xbf')
+
+    def find_literal(self, query):
+        """大文字小文字を無視した ASCII 文字列の検索をバイト列の上で行い、
+        [(行, 開始桁, 終了桁), ...] を返す。展開済みや ASCII 以外のクエリなら None"""
+        if self._lines is not None or not query.isascii() or not query.isprintable():
+            return None
+        data = self._data
+        if not set(query.lower()).isdisjoint("iks") and any(b in data for b in self._ASCII_FOLD_EXTRA):
+            return None
+        pattern = re.compile(re.escape(query.encode('ascii')), re.IGNORECASE)
+        offsets = [m.start() for m in pattern.finditer(data)]
+        if not offsets:
+            return []
+        results = []
+        n = len(query)
+        for off, y in zip(offsets, (np.searchsorted(self._starts, offsets, side='right') - 1).tolist()):
+            # 行頭からのバイト数を文字数に直す
+            x = len(data[self._starts[y]:off].decode('utf-8'))
+            results.append((y, x, x + n))
+        return results
+
+    def max_line_len(self):
+        if self._lines is not None:
+            return super().max_line_len()
+        # 文字数はバイト数以下なので、バイト数の大きい行から順にデコードし、
+        # それまでの最大文字数を超えうる行がなくなったら打ち切る
+        byte_lens = self._ends - self._starts
+        best = 0
+        for i in np.argsort(byte_lens)[::-1]:
+            if byte_lens[i] <= best: break
+            best = max(best, len(self[i]))
+        return best
 
 class MacroManager:
     """CAFFEINE マクロ言語の実行を管理するクラス"""
@@ -810,7 +1134,7 @@ class MacroManager:
         
         try:
             # 許可される文字のみが含まれているか確認（セキュリティのため）
-            if re.match(r'^[0-9\s\+\-\*\/\(\)\%\>\<\=\!\&\|\.]+$', processed_expr):
+            if _MACRO_EXPR_RE.match(processed_expr):
                 return eval(processed_expr)
         except Exception:
             pass
@@ -1035,23 +1359,21 @@ class PluginManager:
         self.items = []
         
         # Active plugins
-        if os.path.exists(self.plugin_dir):
-            for f in glob.glob(os.path.join(self.plugin_dir, "*.py")):
-                if os.path.basename(f).startswith("_"): continue
-                self.items.append({
-                    "name": os.path.basename(f),
-                    "path": f,
-                    "enabled": True
-                })
+        for name, f in _scan_py_files(self.plugin_dir):
+            if name.startswith("_"): continue
+            self.items.append({
+                "name": name,
+                "path": f,
+                "enabled": True
+            })
 
         # Disabled plugins
-        if os.path.exists(self.disabled_dir):
-            for f in glob.glob(os.path.join(self.disabled_dir, "*.py")):
-                self.items.append({
-                    "name": os.path.basename(f),
-                    "path": f,
-                    "enabled": False
-                })
+        for name, f in _scan_py_files(self.disabled_dir):
+            self.items.append({
+                "name": name,
+                "path": f,
+                "enabled": False
+            })
         
         self.items.sort(key=lambda x: x["name"])
         # インデックス範囲の修正
@@ -1797,9 +2119,73 @@ class Terminal:
             if draw_line_y >= y + h: break
             try:
                 stdscr.addstr(draw_line_y, x, " " * w, colors["bg"])
-                stdscr.addstr(draw_line_y, x, line[:w], colors["bg"])
+                # 幅での切り詰めは addnstr に任せる（行をスライスしない）
+                stdscr.addnstr(draw_line_y, x, line, w, colors["bg"])
             except curses.error: pass
 
+        # 出力が少ない時の残りの行も消しておく（画面は毎フレーム消去されない）
+        for draw_line_y in range(content_y + len(display_lines), y + h):
+            try: stdscr.addstr(draw_line_y, x, " " * w, colors["bg"])
+            except curses.error: pass
+
+class FileWatcher:
+    """watchdog で1つのファイル（が置かれたディレクトリ）を監視し、そのファイルの変更だけを記録する"""
+    # 内容の変化を伴わないイベント
+    _IGNORED_EVENTS = ("opened", "closed_no_write")
+
+    def __init__(self):
+        self.target = None # 監視対象ファイルの絶対パス
+        self.changed = False # target に変更イベントがあったか
+        self.directory = None
+        self._observer = None
+        self._watch = None
+
+    def watch(self, path):
+        """監視対象のファイル（絶対パス）を切り替える。監視できなければ False を返す"""
+        self.target = path
+        self.changed = False
+        directory = os.path.dirname(path)
+        if directory == self.directory:
+            return self._watch is not None
+        self.directory = directory
+        try:
+            if self._observer is None:
+                self._observer = Observer()
+                self._observer.start()
+            if self._watch is not None:
+                self._observer.unschedule(self._watch)
+                self._watch = None
+            self._watch = self._observer.schedule(self, directory, recursive=False)
+        except (OSError, RuntimeError):
+            # NFS などで監視できない場合はポーリングに戻る
+            return False
+        return True
+
+    def dispatch(self, event):
+        """watchdog のイベントハンドラ（監視スレッドから呼ばれる）"""
+        if event.is_directory or event.event_type in self._IGNORED_EVENTS: return
+        target = self.target
+        if target is None: return
+        dest = getattr(event, "dest_path", "")
+        if os.path.abspath(event.src_path) == target or (dest and os.path.abspath(dest) == target):
+            self.changed = True
+
+    def pop_changed(self):
+        """監視対象ファイルに変更イベントがあったかを返し、記録を消す"""
+        if self.changed:
+            self.changed = False
+            return True
+        return False
+
+    def stop(self):
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=1)
+            except RuntimeError:
+                pass
+            self._observer = None
+
 class EditorTab:
     """単一の編集タブの状態を保持するクラス"""
     def __init__(self, buffer, filename, syntax_rules, mtime):
@@ -1810,26 +2196,39 @@ class EditorTab:
         self.scroll_offset = 0
         self.col_offset = 0
         self.desired_x = 0
-        self.history = []
-        self.history_index = -1
+        # 履歴は差分 (y_lo, 変更前の行, 変更後の行, 変更前カーソル, 変更後カーソル) のリスト
+        self.history = deque() # undo の差分（古いものは左端から捨てる）
+        self.history_index = 0 # 適用済みの差分の数
+        self.history_clean = 0 # 保存・読み込み時点の history_index
+        self.history_bytes = 0 # history が保持している行データのおおよそのバイト数
+        self.history_buffer = None # 履歴が対象としている Buffer
+        self.undo_pending = None # 変更後の内容がまだ確定していない差分
+        self.undo_typing = None # 文字入力でまとめ中の差分 (undo_pending, y, x, 時刻)
         self.modified = False
         self.mark_pos = None
         self.file_mtime = mtime
         self.current_syntax_rules = syntax_rules
         self.git_status = None # Can be 'M' (modified), 'A' (added/untracked), or None
         self.read_only = False
+        # ハイライト結果のキャッシュ: 行番号 -> (行テキスト, 属性コード)
+        self.hl_cache = OrderedDict()
+        self.hl_cache_rules = None
+        # 大きなファイルではハイライトを無効化する（:hl で切り替え）
+        self.hl_enabled = True
+        self.hl_checked_buffer = None
 
 class Editor:
     def __init__(self, stdscr, filename=None, start_time=None):
         self.stdscr = stdscr
         self.config = DEFAULT_CONFIG.copy()
         self.syntax_rules = DEFAULT_SYNTAX_RULES.copy()
+        self._ext_index = None
         self.build_commands = DEFAULT_BUILD_COMMANDS.copy()
         self.emoji_icons = EMOJI_ICONS.copy()
         self.nerd_font_icons = NERD_FONT_ICONS.copy()
 
-        # プラグインをロードして、カスタム設定とシンタックスを登録
-        self.load_plugins()
+        # プラグインは最初の画面を描画した後に main_loop でロードする（起動を速くするため）
+        self._pending_plugins = True
 
         # ユーザー設定をロード（プラグイン設定を上書き可能）
         user_config, config_error = load_config()
@@ -1854,14 +2253,14 @@ class Editor:
         self.active_tab_idx = 0
         
         # 最初のタブを作成
-        initial_lines, load_err = self.load_file(filename)
+        initial_buffer, load_err = self._load_buffer(filename)
         mtime = None
         if filename and os.path.exists(filename):
             try: mtime = os.path.getmtime(filename)
             except OSError: pass
         
         rules = self.detect_syntax(filename)
-        first_tab = EditorTab(Buffer(initial_lines), filename, rules, mtime)
+        first_tab = EditorTab(initial_buffer, filename, rules, mtime)
         self._update_tab_git_status(first_tab)
         self.tabs.append(first_tab)
         
@@ -1892,7 +2291,30 @@ class Editor:
         self.status_message = ""
         self.status_expire_time = None
         self.clipboard = []
-        
+
+        # 選択範囲のキャッシュ（マーク・カーソルが動いた時だけ再計算）
+        self._sel_cache = None
+        self._sel_cache_pos = None
+        self._sel_cache_key = None
+        # 前フレームの編集領域の内容（画面行 -> 署名）と、画面全体を消去し直すためのフラグ
+        self._last_frame = {}
+        self._frame_layout = None
+        self._frame_dirty = True
+        self._last_render = 0.0
+        # キーバインドヒントの折り返し結果 ((幅, 表示ID), 行リスト)
+        self._menu_cache = None
+        # 検索などで使う正規表現のキャッシュ ((パターン, フラグ) -> コンパイル済み)
+        self._regex_cache = OrderedDict()
+        # カーソル行の累積表示幅 (行テキスト, [0, w0, w0+w1, ...])
+        self._col_width_cache = None
+        # 最後にファイルの外部変更を確認した時刻 (time.monotonic)
+        self._last_mtime_check = 0.0
+        # watchdog による外部変更の監視（使えなければ一定間隔のポーリング）
+        self._file_watcher = FileWatcher() if HAS_WATCHDOG else None
+        self._watch_target = None
+        self._watch_path = None
+        self._watch_active = False
+
         # --- 予測変換の状態 ---
         self.suggestions = []
         self.suggestion_active = False
@@ -1949,7 +2371,9 @@ class Editor:
             'csv': self._command_csv,
             'gemini': self._command_gemini,
             'openai': self._command_openai,
-            'claude': self._command_claude
+            'claude': self._command_claude,
+            'hl': self._command_hl,
+            'highlight': self._command_hl
         }
 
         self.init_colors()
@@ -2024,7 +2448,10 @@ class Editor:
     @property
     def history(self): return self.current_tab.history
     @history.setter
-    def history(self, val): self.current_tab.history = val
+    def history(self, val):
+        tab = self.current_tab
+        tab.history = deque(val)
+        tab.history_bytes = sum(map(_patch_size, tab.history))
 
     @property
     def history_index(self): return self.current_tab.history_index
@@ -2138,10 +2565,22 @@ class Editor:
 
             except curses.error:
                 pass
+        # 描画時に color_pair() を呼ばずに済むよう、ペア番号 -> 属性の表を作っておく
+        self._PAIR = tuple(curses.color_pair(i) for i in range(22))
 
     def detect_syntax(self, filename):
         if not filename: return None
         _, ext = os.path.splitext(filename)
+        # 拡張子 -> ルールの索引（登録順で最初のものを優先）
+        if self._ext_index is None:
+            self._ext_index = {}
+            for rules in self.syntax_rules.values():
+                for e in rules.get("extensions", []):
+                    self._ext_index.setdefault(e, rules)
+        rules = self._ext_index.get(ext)
+        if rules is not None:
+            return rules
+        # 索引作成後に syntax_rules が直接書き換えられた場合に備えて走査する
         for lang, rules in self.syntax_rules.items():
             if ext in rules["extensions"]:
                 return rules
@@ -2150,12 +2589,25 @@ class Editor:
     def load_file(self, filename):
         if filename and os.path.exists(filename):
             try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    content = f.read().splitlines()
-                    return (content if content else [""]), None
+                content = _intern_lines(_read_text_lines(filename))
+                return (content if content else [""]), None
             except (OSError, UnicodeDecodeError) as e:
                 return [""], f"Error loading file: {e}"
         return [""], None
+
+    def _load_buffer(self, filename):
+        """ファイルを Buffer として読み込む。大きなファイルは行を遅延デコードする。"""
+        if HAS_NUMPY and filename and os.path.isfile(filename):
+            try:
+                if os.path.getsize(filename) >= self.config.get("lazy_load_threshold", 1 << 20):
+                    with open(filename, 'rb') as f:
+                        buf = IndexedBuffer.from_bytes(f.read())
+                    if buf is not None:
+                        return buf, None
+            except (OSError, UnicodeDecodeError) as e:
+                return Buffer([""]), f"Error loading file: {e}"
+        lines, err = self.load_file(filename)
+        return Buffer(lines), err
     
     def load_plugins(self):
         plugin_dir = os.path.join(get_config_dir(), "plugins")
@@ -2166,12 +2618,11 @@ class Editor:
                 pass 
                 return
 
-        plugin_files = glob.glob(os.path.join(plugin_dir, "*.py"))
         loaded_count = 0
+        errors = []
         
-        for file_path in plugin_files:
+        for base, file_path in _scan_py_files(plugin_dir):
             try:
-                base = os.path.basename(file_path)
                 if base.startswith("_"): continue
                 module_name = base[:-3]
                 spec = importlib.util.spec_from_file_location(module_name, file_path)
@@ -2182,10 +2633,26 @@ class Editor:
                         module.init(self)
                         loaded_count += 1
             except Exception as e:
-                self.set_status(f"Plugin load error ({os.path.basename(file_path)}): {e}", timeout=5)
+                errors.append(f"{os.path.basename(file_path)}: {e}")
 
-        if loaded_count > 0:
+        # 結果はまとめて1つのメッセージで表示する
+        if errors:
+            self.set_status(f"Loaded {loaded_count} plugins, {len(errors)} failed ({'; '.join(errors)})", timeout=5)
+        elif loaded_count > 0:
             self.set_status(f"Loaded {loaded_count} plugins.", timeout=3)
+        return loaded_count
+
+    def _load_pending_plugins(self):
+        """起動時に保留したプラグインをロードし、登録されたシンタックスをタブに反映する"""
+        self._pending_plugins = False
+        # 自動判定のままのタブだけを判定し直す（差分タブや手動で決めたルールは残す）
+        detected = [self.detect_syntax(tab.filename) for tab in self.tabs]
+        if not self.load_plugins(): return
+        # 既存の言語を上書きするプラグインにも追従するよう索引を作り直す
+        self._ext_index = None
+        for tab, rules in zip(self.tabs, detected):
+            if tab.filename and tab.current_syntax_rules is rules:
+                tab.current_syntax_rules = self.detect_syntax(tab.filename)
 
     def reload_config(self):
         """設定を再読み込みして、関連コンポーネントを更新する"""
@@ -2213,7 +2680,9 @@ class Editor:
     def register_syntax_rule(self, lang_name, rule_dict):
         """プラグインから新しいシンタックスルールを登録する"""
         if lang_name and isinstance(rule_dict, dict) and "extensions" in rule_dict:
+            _compile_rules(rule_dict)
             self.syntax_rules[lang_name] = rule_dict
+            self._ext_index = None
             self.set_status(f"Syntax for '{lang_name}' registered.", timeout=2)
         else:
             self.set_status(f"Invalid syntax rule for '{lang_name}'.", timeout=4)
@@ -2299,6 +2768,7 @@ class Editor:
 
     def _draw_message(self, message, delay_seconds=0):
         """Helper to draw a centered message and wait."""
+        self._invalidate_frame()
         self.stdscr.clear()
         y = self.height // 2
         x = self.width // 2 - len(message) // 2
@@ -2334,10 +2804,11 @@ class Editor:
                 updates_to_save["explorer_icon_theme"] = "emoji"
 
         self._update_and_save_user_config(updates_to_save)
+        self._invalidate_frame()
         self.stdscr.clear()
 
     def get_cursor_position(self): return self.cursor_y, self.cursor_x
-    def get_line_content(self, y): return self.buffer.lines[y] if 0 <= y < len(self.buffer) else ""
+    def get_line_content(self, y): return self.buffer[y] if 0 <= y < len(self.buffer) else ""
     def get_buffer_lines(self): return self.buffer.get_content()
     def get_line_count(self): return len(self.buffer)
     def get_config_value(self, key): return self.config.get(key)
@@ -2373,7 +2844,8 @@ class Editor:
         y1, x1 = start_pos
         y2, x2 = end_pos
         if not (0 <= y1 < len(self.buffer) and 0 <= y2 < len(self.buffer)): return
-        self.save_history()
+        self._push_undo(min(y1, y2), max(y1, y2))
+        self._hl_invalidate(min(y1, y2), -abs(y2 - y1))
         if y1 == y2:
             line = self.buffer.lines[y1]
             x1 = max(0, min(x1, len(line)))
@@ -2391,7 +2863,8 @@ class Editor:
 
     def replace_text(self, y, start_x, end_x, new_text):
         if not (0 <= y < len(self.buffer)): return
-        self.save_history()
+        self._push_undo(y, y)
+        self._hl_invalidate(y)
         line = self.buffer.lines[y]
         start_x = max(0, min(start_x, len(line)))
         end_x = max(0, min(end_x, len(line)))
@@ -2404,7 +2877,13 @@ class Editor:
     def set_status_message(self, msg, timeout=3):
         self.set_status(msg, timeout)
 
+    def _invalidate_frame(self):
+        """画面が外部で消去・上書きされたので、次のフレームで全体を描き直す"""
+        self._last_frame = {}
+        self._frame_dirty = True
+
     def redraw_screen(self):
+        self._invalidate_frame()
         self.stdscr.erase()
         self.draw_ui()
         self.draw_content()
@@ -2423,13 +2902,13 @@ class Editor:
             return None
 
         try:
-            pattern = re.compile(pattern_str)
+            pattern = self._get_pattern(pattern_str)
         except re.error:
             return None
 
         # カーソル行から上に向かってスキャン
         for i in range(self.cursor_y, -1, -1):
-            line = self.buffer.lines[i]
+            line = self.buffer[i]
             match = pattern.search(line)
             if match:
                 # 複数のキャプチャグループがある場合を考慮し、最後のものを優先
@@ -2437,22 +2916,28 @@ class Editor:
         
         return None
 
-    def _get_search_highlight_at(self, y, x):
-        """
-        Checks if the given coordinate (y, x) is part of a search result.
-        Returns:
-            - 'active' if it's the currently active highlighted result.
-            - 'normal' if it's part of any other search result.
-            - None if it's not part of any search result.
-        """
-        # This check can be slow if there are many results.
-        # A more optimized version might use a set or a different data structure.
-        for i, (res_y, start, end) in enumerate(self.search_results):
-            if y == res_y and start <= x < end:
-                if i == self.active_search_idx:
-                    return 'active'
-                return 'normal'
-        return None
+    def _get_pattern(self, query, flags=0, use_re2=False):
+        """正規表現をコンパイルして LRU キャッシュに保持する（re.error はそのまま送出）。
+        use_re2=True なら RE2 が使える時はそちらでコンパイルする（後方参照などは re で）。"""
+        key = (query, flags, use_re2)
+        cache = self._regex_cache
+        pattern = cache.get(key)
+        if pattern is None:
+            if use_re2 and HAS_RE2 and not flags & ~re.IGNORECASE:
+                options = re2.Options()
+                options.log_errors = False  # curses の画面に stderr が混ざらないように
+                options.case_sensitive = not flags & re.IGNORECASE
+                try:
+                    pattern = re2.compile(query, options)
+                except re2.error:
+                    pattern = None
+            if pattern is None:
+                pattern = re.compile(query, flags)
+            cache[key] = pattern
+            if len(cache) > 128: cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return pattern
 
     def _find_all_matches(self, jump_to_first=True):
         """Finds all occurrences of self.search_query in the buffer and updates the results."""
@@ -2464,14 +2949,45 @@ class Editor:
 
         try:
             # Case-insensitive search for now, could be made an option
-            pattern = re.compile(self.search_query, re.IGNORECASE)
+            pattern = self._get_pattern(self.search_query, re.IGNORECASE, use_re2=True)
         except re.error as e:
             self.set_status(f"Regex Error: {e}", timeout=4)
             return
 
-        for y, line in enumerate(self.buffer.lines):
-            for match in pattern.finditer(line):
-                self.search_results.append((y, match.start(), match.end()))
+        found = None
+        if _REGEX_META.isdisjoint(self.search_query) and isinstance(self.buffer, IndexedBuffer):
+            # 未編集の大きなファイルは行に展開せず、読み込んだバイト列をそのまま検索する
+            found = self.buffer.find_literal(self.search_query)
+        if found is not None:
+            self.search_results = found
+        elif _REGEX_META.isdisjoint(self.search_query):
+            lines = self.buffer.lines
+            # メタ文字を含まないクエリは行をまたいでマッチしないので、
+            # 全行を連結して一度に走査し、位置を行頭オフセットから (行, 桁) に戻す
+            text = "\n".join(lines)
+            starts = list(accumulate(map((1).__add__, map(len, lines[:-1])), initial=0))
+            query = self.search_query
+            if query.isascii() and text.isascii():
+                # ASCII だけなら小文字にそろえて str.find で探す（大文字小文字を無視した正規表現より速い。
+                # 非ASCIIの K (U+212A) なども無いので結果は正規表現と同じ）
+                text = text.lower()
+                query = query.lower()
+                qlen = len(query)
+                find = text.find
+                start = find(query)
+                while start >= 0:
+                    y = bisect.bisect_right(starts, start) - 1
+                    self.search_results.append((y, start - starts[y], start + qlen - starts[y]))
+                    start = find(query, start + qlen)
+            else:
+                for match in pattern.finditer(text):
+                    start = match.start()
+                    y = bisect.bisect_right(starts, start) - 1
+                    self.search_results.append((y, start - starts[y], match.end() - starts[y]))
+        else:
+            for y, line in enumerate(self.buffer.lines):
+                for match in pattern.finditer(line):
+                    self.search_results.append((y, match.start(), match.end()))
         
         if self.search_results:
             if jump_to_first:
@@ -2503,8 +3019,7 @@ class Editor:
             if isinstance(key_in, int):
                 key_code = key_in
             elif isinstance(key_in, str) and len(key_in) == 1:
-                code = ord(key_in)
-                if code < 32 or code == 127: key_code = code
+                if key_in in _CONTROL_CHARS: key_code = ord(key_in)
                 else: char_input = key_in
 
             if key_code in (KEY_ENTER, KEY_RETURN):
@@ -2590,8 +3105,7 @@ class Editor:
         if not is_git_tracked:
             if self.filename and os.path.exists(self.filename):
                 try:
-                    with open(self.filename, 'r', encoding='utf-8') as f:
-                        original_lines = f.read().splitlines()
+                    original_lines = _read_text_lines(self.filename)
                 except (OSError, UnicodeDecodeError):
                     return ["Error: Could not read original file from disk."]
             else:
@@ -2599,7 +3113,8 @@ class Editor:
                 original_lines = []
 
         # 3. Get current buffer content
-        current_lines = self.buffer.get_content()
+        # （difflib は読むだけなので、コピーせずにバッファの行をそのまま渡す）
+        current_lines = self.buffer.lines
 
         # 4. Generate the diff
         diff = list(difflib.unified_diff(
@@ -2884,7 +3399,7 @@ class Editor:
                 self.vim_last_key = 'y'
             elif char_input == 'x':
                 if self.buffer.lines:
-                    self.save_history()
+                    self._push_undo(self.cursor_y, self.cursor_y)
                     line = self.buffer.lines[self.cursor_y]
                     if line and self.cursor_x < len(line):
                         char = line[self.cursor_x]
@@ -2896,12 +3411,13 @@ class Editor:
                 self._sync_from_system_clipboard()
 
                 if self.clipboard:
-                    self.save_history()
                     if self.vim_clipboard_type == 'line':
-                        # 行単位の貼り付け
+                        # 行単位の貼り付け（挿入位置の行だけを変更範囲として記録する）
+                        self._push_undo(self.cursor_y, self.cursor_y)
                         content_to_insert = self.clipboard[:-1] if self.clipboard and self.clipboard[-1] == '' else self.clipboard
                         insert_y = self.cursor_y + 1 if char_input == 'p' else self.cursor_y
                         self.buffer.lines[insert_y:insert_y] = content_to_insert
+                        self._hl_invalidate(insert_y - 1, len(content_to_insert))
                         self.move_cursor(insert_y, 0, update_desired_x=True)
                     else:
                         if char_input == 'p':
@@ -2928,9 +3444,9 @@ class Editor:
         elif cmd_key in (KEY_ENTER, KEY_RETURN):
             res = self.explorer.enter()
             if res:
-                new_lines, err = self.load_file(res)
+                new_buffer, err = self._load_buffer(res)
                 if not err:
-                    self.buffer = Buffer(new_lines)
+                    self.buffer = new_buffer
                     self.filename = res
                     try:
                         self.file_mtime = os.path.getmtime(res)
@@ -3024,9 +3540,8 @@ class Editor:
             self.set_status("No active match to replace.", timeout=2)
             return
 
-        self.save_history()
-
         y, start_x, end_x = self.search_results[self.active_search_idx]
+        self._push_undo(y, y)
         line = self.buffer.lines[y]
         
         # Replace the text
@@ -3056,7 +3571,8 @@ class Editor:
             self.set_status("No matches to replace.", timeout=2)
             return
 
-        self.save_history()
+        # 結果は行順に並んでいるので、最初と最後の行の間だけを記録する
+        self._push_undo(self.search_results[0][0], self.search_results[-1][0])
         replacements_count = len(self.search_results)
         # Iterate backwards to avoid messing up indices
         for y, start_x, end_x in reversed(self.search_results):
@@ -3095,6 +3611,7 @@ class Editor:
 
         while True:
             self.height, self.width = self.stdscr.getmaxyx()
+            self._invalidate_frame()
             self.stdscr.erase()
             self.draw_tab_bar()
             self.draw_ui()
@@ -3182,6 +3699,7 @@ class Editor:
         self.active_pane = 'template_selector' # Special pane state
 
         while True:
+            self._invalidate_frame()
             self.stdscr.erase()
             # Draw a minimal background UI
             self.draw_tab_bar()
@@ -3250,8 +3768,9 @@ class Editor:
     # ==========================================
 
     def insert_text(self, text):
-        self.save_history()
-        lines_to_insert = text.split('\n')
+        self._push_undo(self.cursor_y, self.cursor_y)
+        lines_to_insert = _intern_lines(text.split('\n'))
+        self._hl_invalidate(self.cursor_y, len(lines_to_insert) - 1)
         current_line = self.buffer.lines[self.cursor_y]
         prefix = current_line[:self.cursor_x]
         suffix = current_line[self.cursor_x:]
@@ -3259,60 +3778,142 @@ class Editor:
             self.buffer.lines[self.cursor_y] = prefix + lines_to_insert[0] + suffix
             self.move_cursor(self.cursor_y, self.cursor_x + len(lines_to_insert[0]))
         else:
-            self.buffer.lines[self.cursor_y] = prefix + lines_to_insert[0]
-            for i in range(1, len(lines_to_insert) - 1):
-                self.buffer.lines.insert(self.cursor_y + i, lines_to_insert[i])
-            self.buffer.lines.insert(self.cursor_y + len(lines_to_insert) - 1, lines_to_insert[-1] + suffix)
+            # 1回のスライス代入で挿入する（後ろの行のずらしは1回で済む）
+            self.buffer.lines[self.cursor_y:self.cursor_y + 1] = (
+                [prefix + lines_to_insert[0]] + lines_to_insert[1:-1] + [lines_to_insert[-1] + suffix])
             new_y = self.cursor_y + len(lines_to_insert) - 1
             new_x = len(lines_to_insert[-1])
             self.move_cursor(new_y, new_x)
         self.modified = True
 
-    def save_history(self, init=False):
-        snapshot = (self.buffer.get_content(), self.cursor_y, self.cursor_x)
-        if self.history_index < len(self.history) - 1:
-            self.history = self.history[:self.history_index + 1]
-        if not init and self.history and self.history[-1][0] == snapshot[0]:
+    def _undo_tab(self):
+        """現在のタブを返す。バッファが差し替えられていれば履歴を作り直す"""
+        tab = self.current_tab
+        if tab.history_buffer is not tab.buffer:
+            tab.history = deque()
+            tab.history_index = 0
+            tab.history_clean = -1 if tab.modified else 0
+            tab.history_bytes = 0
+            tab.history_buffer = tab.buffer
+            tab.undo_pending = None
+        return tab
+
+    def _push_undo(self, y_lo, y_hi):
+        """y_lo〜y_hi 行目を書き換える直前に呼び、その範囲だけを履歴に記録する。
+        変更後の内容は次の記録・undo・redo の時に確定する。"""
+        self._finalize_undo()
+        tab = self._undo_tab()
+        lines = tab.buffer.lines
+        y_lo = max(0, y_lo)
+        y_hi = min(y_hi, len(lines) - 1)
+        tab.undo_pending = (y_lo, lines[y_lo:y_hi + 1], len(lines), (tab.cursor_y, tab.cursor_x))
+
+    def _push_typing_undo(self):
+        """文字入力の直前に呼ぶ _push_undo。直前の入力の続き（同じ行・同じ位置、
+        _TYPING_UNDO_MERGE 秒以内）なら記録中の差分をそのまま使い、1つの undo にまとめる"""
+        tab = self._undo_tab()
+        typing = tab.undo_typing
+        if (typing is not None and typing[0] is tab.undo_pending
+                and typing[1] == self.cursor_y and typing[2] == self.cursor_x
+                and time.monotonic() - typing[3] < _TYPING_UNDO_MERGE):
             return
-        self.history.append(snapshot)
-        self.history_index = len(self.history) - 1
+        self._push_undo(self.cursor_y, self.cursor_y)
+
+    def _end_typing_undo(self):
+        """文字入力の直後に呼び、次の入力がこの差分に続けられるよう位置と時刻を覚える"""
+        tab = self._undo_tab()
+        tab.undo_typing = (tab.undo_pending, self.cursor_y, self.cursor_x, time.monotonic())
+
+    def _finalize_undo(self):
+        """記録中の差分に変更後の行を確定させて履歴に積む"""
+        tab = self._undo_tab()
+        pending = tab.undo_pending
+        if pending is None: return
+        tab.undo_pending = None
+        y_lo, pre, n_before, cursor_pre = pending
+        lines = tab.buffer.lines
+        post = lines[y_lo:len(lines) - (n_before - y_lo - len(pre))]
+        if post == pre: return
+        # 前後の変わっていない行を除き、実際に変わった範囲だけを残す
+        # （バッファ全体を記録した編集でも履歴には差分しか残らない）
+        lo, n = 0, min(len(pre), len(post))
+        while lo < n and pre[lo] == post[lo]: lo += 1
+        k = 0
+        while k < n - lo and pre[-1 - k] == post[-1 - k]: k += 1
+        if lo or k:
+            y_lo += lo
+            pre = pre[lo:len(pre) - k]
+            post = post[lo:len(post) - k]
+        # redo 用の差分は捨てる
+        if tab.history_index < len(tab.history):
+            while len(tab.history) > tab.history_index:
+                tab.history_bytes -= _patch_size(tab.history.pop())
+            if tab.history_clean > tab.history_index: tab.history_clean = -1
+        record = (y_lo, pre, post, cursor_pre, (tab.cursor_y, tab.cursor_x))
+        tab.history.append(record)
+        tab.history_bytes += _patch_size(record)
+        tab.history_index += 1
+        # 件数と行データの量の両方で古い差分から捨てる（直前の1件は必ず残す）
         limit = self.config.get("history_limit", 50)
-        if len(self.history) > limit:
-            self.history.pop(0)
-            self.history_index -= 1
-        if not init:
-            self.modified = True
+        bytes_limit = self.config.get("history_bytes_limit", 524288)
+        while len(tab.history) > 1 and (len(tab.history) > limit or tab.history_bytes > bytes_limit):
+            tab.history_bytes -= _patch_size(tab.history.popleft())
+            tab.history_index -= 1
+            tab.history_clean -= 1
+
+    def save_history(self, init=False):
+        """履歴を記録する。init=True なら現在の状態を保存済み（未変更）の基点にする。
+        範囲の分からない編集ではバッファ全体を変更範囲として記録する。"""
+        if init:
+            self._finalize_undo()
+            tab = self._undo_tab()
+            tab.history_clean = tab.history_index
+            return
+        self._push_undo(0, len(self.buffer) - 1)
+        self.modified = True
+
+    def _apply_patch(self, y_lo, old, new, cursor):
+        """y_lo 行目からの old を new に置き換え、カーソルを戻す"""
+        self._hl_invalidate(y_lo, len(new) - len(old))
+        self.buffer.lines[y_lo:y_lo + len(old)] = new
+        self.move_cursor(cursor[0], cursor[1], update_desired_x=True, check_bounds=True)
+        self.scroll_offset = max(0, self.cursor_y - self.get_edit_height() // 2)
+        self.modified = self.history_index != self.current_tab.history_clean
+        self.status_message = f"Applied history state {self.history_index}/{len(self.history)}"
 
     def apply_history(self, index):
-        if 0 <= index < len(self.history):
-            self.history_index = index
-            snapshot = self.history[index]
-            self.buffer.set_content(snapshot[0])
-            self.move_cursor(snapshot[1], snapshot[2], update_desired_x=True, check_bounds=True)
-            self.scroll_offset = max(0, self.cursor_y - self.get_edit_height() // 2)
-            self.modified = self.history_index != 0
-            self.status_message = f"Applied history state {index+1}/{len(self.history)}"
+        self._finalize_undo()
+        if 0 <= index <= len(self.history):
+            while self.history_index > index: self.undo()
+            while self.history_index < index: self.redo()
 
     def undo(self):
-        if self.history_index > 0: self.apply_history(self.history_index - 1)
+        self._finalize_undo()
+        if self.history_index > 0:
+            self.history_index -= 1
+            y_lo, pre, post, cursor_pre, _ = self.history[self.history_index]
+            self._apply_patch(y_lo, post, pre, cursor_pre)
         else: self.status_message = "Nothing to undo."
 
     def redo(self):
-        if self.history_index < len(self.history) - 1: self.apply_history(self.history_index + 1)
+        self._finalize_undo()
+        if self.history_index < len(self.history):
+            y_lo, pre, post, _, cursor_post = self.history[self.history_index]
+            self.history_index += 1
+            self._apply_patch(y_lo, pre, post, cursor_post)
         else: self.status_message = "Nothing to redo."
 
     def safe_addstr(self, y, x, string, attr=0):
+        if y >= self.height or x >= self.width: return
+        # 画面幅での切り詰めは addnstr / insnstr に任せる
+        available = self.width - x
         try:
-            if y >= self.height or x >= self.width: return
-            available = self.width - x
-            if len(string) > available: string = string[:available]
-
             # Known curses bug: addstr to bottom-right corner raises an error.
             # Use insstr() for this specific case to avoid it.
-            if y == self.height - 1 and len(string) == available:
-                self.stdscr.insstr(y, x, string, attr)
+            if y == self.height - 1 and len(string) >= available:
+                self.stdscr.insnstr(y, x, string, available, attr)
             else:
-                self.stdscr.addstr(y, x, string, attr)
+                self.stdscr.addnstr(y, x, string, available, attr)
         except curses.error:
             pass
 
@@ -3380,6 +3981,7 @@ class Editor:
         selected_index = 0
 
         while True:
+            self._invalidate_frame()
             self.stdscr.erase()
             self.height, self.width = self.stdscr.getmaxyx()
 
@@ -3416,6 +4018,7 @@ class Editor:
                 return -1 # Cancel
 
     def show_start_screen(self, duration_ms=None, interactive=False):
+        self._invalidate_frame()
         self.stdscr.clear()
         self.draw_tab_bar()
         # Pair 3 is CYAN (Text)
@@ -3472,13 +4075,25 @@ class Editor:
         return p1, p2
 
     def is_in_selection(self, y, x):
-        sel = self.get_selection_range()
-        if not sel: return False
-        start, end = sel
-        if start[0] == end[0]: return y == start[0] and start[1] <= x < end[1]
-        if y == start[0]: return x >= start[1]
-        if y == end[0]: return x < end[1]
-        return start[0] < y < end[0]
+        self._selection_cached()
+        pos = self._sel_cache_pos
+        return pos is not None and pos[0] <= (y << _SEL_COL_BITS) + x < pos[1]
+
+    def _selection_cached(self):
+        """get_selection_range の結果。マーク・カーソルが動いた時だけ作り直す"""
+        sel_key = (self.mark_pos, self.cursor_y, self.cursor_x)
+        if self._sel_cache_key != sel_key:
+            sel = self.get_selection_range()
+            self._sel_cache = sel
+            # (行, 桁) を1つの整数にした範囲 [lo, hi)（1点の判定を整数の比較2回で済ませる）
+            self._sel_cache_pos = None if not sel else (
+                (sel[0][0] << _SEL_COL_BITS) + sel[0][1], (sel[1][0] << _SEL_COL_BITS) + sel[1][1])
+            self._sel_cache_key = sel_key
+        return self._sel_cache
+
+    def get_linenum_width(self):
+        """行番号欄の幅（末尾の区切り1文字を含む）"""
+        return max(4, len(str(len(self.buffer)))) + 1
 
     def get_edit_rect(self):
         breadcrumb_h = 1 if self.config.get("show_breadcrumb", True) else 0
@@ -3526,6 +4141,38 @@ class Editor:
         _, _, h, _ = self.get_edit_rect()
         return max(1, h)
 
+    def _compute_attrs(self, line, file_line_idx, compiled, is_diff_view=False, is_csv_preview=False):
+        """1行分のハイライトコード（カラーペア番号の bytearray, 0 = 通常）を計算する"""
+        line_attrs = bytearray(len(line))
+        if is_diff_view:
+            if line.startswith('+'):
+                line_attrs[:] = bytes([16]) * len(line)
+            elif line.startswith('-'):
+                line_attrs[:] = bytes([17]) * len(line)
+        elif is_csv_preview:
+            if file_line_idx == 1: # Header row
+                line_attrs[:] = bytes([HL_STRING]) * len(line)
+        if compiled:
+            _highlight_line(compiled, line, line_attrs)
+        return line_attrs
+
+    def _hl_invalidate(self, y, delta=0):
+        """y 行目を編集したことをハイライトキャッシュに伝える。
+        delta は y 行目より後ろで増えた(正)/消えた(負)行数。"""
+        cache = self.current_tab.hl_cache
+        if not delta:
+            cache.pop(y, None)
+            return
+        shifted = OrderedDict()
+        for k, v in cache.items():
+            if k < y:
+                shifted[k] = v
+            elif k == y or (delta < 0 and k <= y - delta):
+                continue
+            else:
+                shifted[k + delta] = v
+        self.current_tab.hl_cache = shifted
+
     def draw_content(self):
         # Plugin Manager Draw Handling
         if self.active_pane == 'plugin_manager':
@@ -3563,133 +4210,188 @@ class Editor:
             self.explorer.draw(self.stdscr, 1, 0, self.height - 2, self.width, colors)
             return
 
-        linenum_width = max(4, len(str(len(self.buffer)))) + 1
+        linenum_width = self.get_linenum_width()
         edit_y, edit_x, edit_h, edit_w = self.get_edit_rect()
         
-        ATTR_NORMAL = 0
-        ATTR_KEYWORD = curses.color_pair(5)
-        ATTR_STRING = curses.color_pair(6)
-        ATTR_COMMENT = curses.color_pair(7)
-        ATTR_NUMBER = curses.color_pair(8)
-        ATTR_ZENKAKU = curses.color_pair(9)
-        ATTR_SELECT = curses.color_pair(4)
-        ATTR_DIFF_ADD = curses.color_pair(16)
-        ATTR_DIFF_REMOVE = curses.color_pair(17)
+        # 属性コードはカラーペア番号そのもの（0 は通常表示）
+        code_attrs = self._PAIR
 
         is_diff_view = self.current_syntax_rules and self.current_syntax_rules.get("language_name") == "diff"
         is_csv_preview = self.current_syntax_rules and self.current_syntax_rules.get("language_name") == "csv_preview"
 
+        tab = self.current_tab
+        # 大きなファイルは読み込み後に一度だけ判定してハイライトを止める
+        if tab.hl_checked_buffer is not tab.buffer:
+            tab.hl_checked_buffer = tab.buffer
+            buf = tab.buffer
+            if self.current_syntax_rules and (len(buf) > self.config.get("hl_max_lines", 5000) or
+                    buf.max_line_len() > self.config.get("hl_max_line_len", 16384)):
+                tab.hl_enabled = False
+                self.set_status("Highlighting disabled (large file). Use :hl to enable.", timeout=5)
+
+        # コンパイル済みパターン（文字列が書き換えられていれば再コンパイル）
+        compiled = None
+        if self.current_syntax_rules and tab.hl_enabled:
+            compiled = _compile_rules(self.current_syntax_rules)
+        if tab.hl_cache_rules is not compiled:
+            tab.hl_cache.clear()
+            tab.hl_cache_rules = compiled
+        hl_cache = tab.hl_cache
+        hl_cache_cap = max(2 * edit_h, 16)
+        hl_max_line_len = self.config.get("hl_max_line_len", 16384)
+
+        # 表示範囲内の検索結果を行ごとにまとめる（search_results は行順に並んでいる）
+        search_spans = {}
+        results = self.search_results
+        if results:
+            last_y = self.scroll_offset + edit_h
+            for idx in range(bisect.bisect_left(results, (self.scroll_offset,)), len(results)):
+                res_y, start, end = results[idx]
+                if res_y >= last_y: break
+                search_spans.setdefault(res_y, []).append((idx, start, end))
+
+        # 行ごとの描画内容。変化のない行はスキップする
+        last_frame = self._last_frame
+        new_frame = {}
+
+        # ループ内で毎行参照する値はローカルに取っておく
+        buffer = self.buffer
+        buffer_len = len(buffer)
+        scroll_offset = self.scroll_offset
+        col_offset = self.col_offset
+        cursor_y = self.cursor_y
+        active_search_idx = self.active_search_idx
+        show_relative = self.config.get("show_relative_linenum", False)
+        safe_addstr = self.safe_addstr
+        chgat = self.stdscr.chgat
+        # 選択範囲はフレームごとに1回だけ求め、行ごとには範囲の比較だけを行う
+        sel = self._selection_cached()
+        if sel:
+            (sel_sy, sel_sx), (sel_ey, sel_ex) = sel
+        attr_linenum = code_attrs[3]
+        lw = linenum_width - 1
+        base_x = edit_x + linenum_width
+        max_content_width = max(0, edit_w - linenum_width)
+
         for i in range(edit_h):
-            file_line_idx = self.scroll_offset + i
+            file_line_idx = scroll_offset + i
             draw_y = edit_y + i
             
-            try:
-                self.stdscr.addstr(draw_y, edit_x, " " * edit_w)
-            except curses.error: pass
-            
-            if file_line_idx >= len(self.buffer):
-                self.safe_addstr(draw_y, edit_x, "~", curses.color_pair(3))
+            if file_line_idx >= buffer_len:
+                sig = (edit_x, edit_w, None)
+                if last_frame.get(draw_y) == sig: continue
+                new_frame[draw_y] = sig
+                safe_addstr(draw_y, edit_x, "~", attr_linenum)
+                safe_addstr(draw_y, edit_x + 1, " " * (edit_w - 1))
             else:
                 # --- 相対行数表示の処理 ---
-                show_relative = self.config.get("show_relative_linenum", False)
-                ln_str = ""
-                if show_relative:
-                    if file_line_idx == self.cursor_y:
-                        # カーソル行は絶対行数を表示
-                        ln_str = str(file_line_idx + 1).rjust(linenum_width - 1) + " "
-                    else:
-                        # それ以外は相対行数を表示
-                        relative_num = abs(file_line_idx - self.cursor_y)
-                        ln_str = str(relative_num).rjust(linenum_width - 1) + " "
+                if show_relative and file_line_idx != cursor_y:
+                    # カーソル行以外は相対行数を表示
+                    ln_str = str(abs(file_line_idx - cursor_y)).rjust(lw) + " "
                 else:
-                    # 通常の絶対行数表示
-                    ln_str = str(file_line_idx + 1).rjust(linenum_width - 1) + " "
-                
-                self.safe_addstr(draw_y, edit_x, ln_str, curses.color_pair(3))
+                    # 通常の絶対行数表示（相対表示でもカーソル行は絶対行数）
+                    ln_str = str(file_line_idx + 1).rjust(lw) + " "
                 
-                line = self.buffer[file_line_idx]
+                line = buffer[file_line_idx]
                 
-                # --- 横スクロール対応: 表示領域に合わせて文字列をスライス ---
-                max_content_width = edit_w - linenum_width
-                
-                # col_offsetに基づいて表示部分を切り出し
-                display_line = line[self.col_offset : self.col_offset + max_content_width]
+                # --- 横スクロール対応: col_offsetに基づいて表示部分を切り出し ---
+                display_line = line[col_offset : col_offset + max_content_width]
                 
                 # --- シンタックスハイライト (全体に対して計算し、表示時にシフト) ---
-                line_attrs = [ATTR_NORMAL] * len(line)
-                
-                if is_diff_view:
-                    if line.startswith('+'):
-                        for j in range(len(line_attrs)): line_attrs[j] = ATTR_DIFF_ADD
-                    elif line.startswith('-'):
-                        for j in range(len(line_attrs)): line_attrs[j] = ATTR_DIFF_REMOVE
-                elif is_csv_preview:
-                    if file_line_idx == 1: # Header row
-                        for j in range(len(line_attrs)): line_attrs[j] = ATTR_STRING
-                
-                if self.current_syntax_rules:
-                    if "keywords" in self.current_syntax_rules:
-                        for match in re.finditer(self.current_syntax_rules["keywords"], line):
-                            for j in range(match.start(), match.end()):
-                                if j < len(line_attrs): line_attrs[j] = ATTR_KEYWORD
-                    if "numbers" in self.current_syntax_rules:
-                        for match in re.finditer(self.current_syntax_rules["numbers"], line):
-                             for j in range(match.start(), match.end()):
-                                if j < len(line_attrs): line_attrs[j] = ATTR_NUMBER
-                    if "strings" in self.current_syntax_rules:
-                        for match in re.finditer(self.current_syntax_rules["strings"], line):
-                            for j in range(match.start(), match.end()):
-                                if j < len(line_attrs): line_attrs[j] = ATTR_STRING
-                    if "comments" in self.current_syntax_rules:
-                         for match in re.finditer(self.current_syntax_rules["comments"], line):
-                            for j in range(match.start(), match.end()):
-                                if j < len(line_attrs): line_attrs[j] = ATTR_COMMENT
-
-                # --- 描画ループ ---
-                base_x = edit_x + linenum_width
-                current_screen_x = base_x
-
-                for cx, char in enumerate(display_line):
-                    if current_screen_x >= edit_x + edit_w:
-                        break
-
-                    # 実際のバッファ上のインデックス
-                    real_index = self.col_offset + cx
-                    
-                    attr = ATTR_NORMAL
-                    if real_index < len(line_attrs):
-                        attr = line_attrs[real_index]
-
-                    # Apply search highlighting, but allow selection to override it
-                    highlight_type = self._get_search_highlight_at(file_line_idx, real_index)
-                    if highlight_type == 'active':
-                        attr = curses.color_pair(21)
-                    elif highlight_type == 'normal':
-                        attr = curses.color_pair(20)
-                    
-                    if self.is_in_selection(file_line_idx, real_index):
-                        attr = ATTR_SELECT
-
-                    char_width = get_char_width(char)
-                    
-                    if current_screen_x + char_width > edit_x + edit_w:
-                        break
-
-                    if char == '\u3000':
-                        self.safe_addstr(draw_y, current_screen_x, "　", ATTR_ZENKAKU)
-                    else:
-                        self.safe_addstr(draw_y, current_screen_x, char, attr)
+                # 行テキストが変わっていなければキャッシュ済みの属性を使う
+                cached = hl_cache.get(file_line_idx)
+                if cached is not None and cached[0] == line:
+                    line_attrs = cached[1]
+                    hl_cache.move_to_end(file_line_idx)
+                else:
+                    line_attrs = self._compute_attrs(line, file_line_idx,
+                                                     compiled if len(line) <= hl_max_line_len else None,
+                                                     is_diff_view, is_csv_preview)
+                    hl_cache[file_line_idx] = (line, line_attrs)
+                    if len(hl_cache) > hl_cache_cap:
+                        hl_cache.popitem(last=False)
+
+                # --- 描画 ---
+                # 画面に収まる文字数を求める（全角は2セル）
+                cols = None
+                per_char = False
+                if display_line.isascii():
+                    n = min(len(display_line), max_content_width)
+                else:
+                    cols = []
+                    total_w = 0
+                    for char in display_line:
+                        char_width = get_char_width(char)
+                        if total_w + char_width > max_content_width: break
+                        cols.append(total_w)
+                        total_w += char_width
+                        # 結合文字は前のセルに重なるので1文字ずつ置く
+                        if unicodedata.combining(char): per_char = True
+                    n = len(cols)
+                    cols.append(total_w)
+                text = display_line[:n]
+
+                # 行の属性コードに検索ハイライト・選択範囲・全角スペースを重ねる
+                codes = bytearray(line_attrs[col_offset:col_offset + n])
+                for idx, start, end in reversed(search_spans.get(file_line_idx, ())):
+                    start = max(start - col_offset, 0)
+                    end = min(end - col_offset, n)
+                    if start < end:
+                        codes[start:end] = (b'\x15' if idx == active_search_idx else b'\x14') * (end - start)
+                if sel and sel_sy <= file_line_idx <= sel_ey:
+                    start = max((sel_sx if file_line_idx == sel_sy else 0) - col_offset, 0)
+                    end = min((sel_ex if file_line_idx == sel_ey else len(line)) - col_offset, n)
+                    if start < end:
+                        codes[start:end] = b'\x04' * (end - start)
+                # 全角スペースは選択中でも目立たせる（ASCII 行には現れない）
+                if cols is not None:
+                    for m in _ZEN_FINDER.finditer(text):
+                        start, end = m.span()
+                        codes[start:end] = b'\x09' * (end - start)
+
+                # 前回のフレームと同じ内容ならこの行は書き直さない
+                sig = (edit_x, edit_w, ln_str, text, bytes(codes))
+                if last_frame.get(draw_y) == sig: continue
+                new_frame[draw_y] = sig
+
+                if _CTRL_CHARS_RE.search(text):
+                    text = text.translate(_CTRL_DISPLAY)
+
+                safe_addstr(draw_y, edit_x, ln_str, attr_linenum)
+                # 1行をまとめて書き（残りは空白で埋める）、属性は連続区間ごとに chgat で付ける
+                if per_char:
+                    # 結合文字は前のセルに重なるので、結合文字だけを自分の列に1文字ずつ置く
+                    safe_addstr(draw_y, base_x, " " * max_content_width)
+                    seg = 0
+                    for k, char in enumerate(text):
+                        if unicodedata.combining(char):
+                            if seg < k: safe_addstr(draw_y, base_x + cols[seg], text[seg:k])
+                            safe_addstr(draw_y, base_x + cols[k], char)
+                            seg = k + 1
+                    if seg < n: safe_addstr(draw_y, base_x + cols[seg], text[seg:])
+                else:
+                    text_w = n if cols is None else cols[n]
+                    safe_addstr(draw_y, base_x, text + " " * (max_content_width - text_w))
+                for run in _ATTR_RUN_RE.finditer(codes):
+                    code = codes[run.start()]
+                    if not code: continue
+                    start, end = run.span()
+                    if cols is not None:
+                        start, end = cols[start], cols[end]
+                    try:
+                        chgat(draw_y, base_x + start, end - start, code_attrs[code])
+                    except curses.error: pass
 
-                    current_screen_x += char_width
+        last_frame.update(new_frame)
 
         # --- Explorer & Terminal Draw ---
         if self.show_explorer:
             ey, ex, eh, ew = self.get_explorer_rect()
             colors = {
-                "ui_border": curses.color_pair(10),
-                "header": curses.color_pair(1),
-                "dir": curses.color_pair(11),
-                "file": curses.color_pair(12)
+                "ui_border": self._PAIR[10],
+                "header": self._PAIR[1],
+                "dir": self._PAIR[11],
+                "file": self._PAIR[12]
             }
             if self.active_pane == 'explorer':
                 colors["ui_border"] = colors["ui_border"] | curses.A_BOLD
@@ -3698,20 +4400,41 @@ class Editor:
         if self.show_terminal:
             ty, tx, th, tw = self.get_terminal_rect()
             colors = {
-                "ui_border": curses.color_pair(10),
-                "header": curses.color_pair(1),
-                "bg": curses.color_pair(13)
+                "ui_border": self._PAIR[10],
+                "header": self._PAIR[1],
+                "bg": self._PAIR[13]
             }
             if self.active_pane == 'terminal':
                 colors["ui_border"] = colors["ui_border"] | curses.A_BOLD
             self.terminal.draw(self.stdscr, ty, tx, th, tw, colors)
 
+    def _cursor_display_offset(self):
+        """col_offset からカーソルまでの表示幅。
+        同じ行の上でカーソルだけが動く間は文字位置ごとの累積幅を使い回す。"""
+        line = self.buffer[self.cursor_y]
+        segment = line[self.col_offset:self.cursor_x]
+        if segment.isascii():
+            return len(segment)
+        cached = self._col_width_cache
+        if cached is not None and cached[0] == line:
+            cum = cached[1]
+            if cum is None:
+                cum = [0]
+                cum.extend(accumulate(map(get_char_width, line)))
+                self._col_width_cache = (line, cum)
+            end = min(self.cursor_x, len(line))
+            return cum[end] - cum[min(self.col_offset, end)]
+        # 入力中など行が変わった直後は区間だけを数え、長い行の表を毎回作り直さない
+        # （累積幅は同じ行が次のフレームでも変わっていなければ作る）
+        self._col_width_cache = (line, None)
+        return sum(map(get_char_width, segment))
+
     def _draw_suggestions(self):
         """Draw the predictive text suggestions box if active."""
         if not self.suggestion_active or not self.suggestions:
             return
 
-        linenum_width = max(4, len(str(len(self.buffer)))) + 1
+        linenum_width = self.get_linenum_width()
         edit_y, edit_x, _, _ = self.get_edit_rect()
         
         # Calculate screen position of the cursor
@@ -3720,9 +4443,7 @@ class Editor:
         screen_x = edit_x + linenum_width
         if self.cursor_y < len(self.buffer):
             if self.cursor_x >= self.col_offset:
-                visible_segment = self.buffer.lines[self.cursor_y][self.col_offset : self.cursor_x]
-                for char in visible_segment:
-                    screen_x += get_char_width(char)
+                screen_x += self._cursor_display_offset()
 
         # Basic layout for the suggestion box
         popup_y = screen_y + 1
@@ -3746,10 +4467,12 @@ class Editor:
             attr = curses.A_REVERSE if i == self.selected_suggestion_idx else curses.A_NORMAL
             
             # Use a color pair that stands out, e.g., header colors
-            bg_attr = curses.color_pair(1)
+            bg_attr = self._PAIR[1]
             
             display_str = f" {suggestion.ljust(max_len)} "
             self.safe_addstr(y, popup_x, display_str, attr | bg_attr)
+            # ポップアップが消えた後にこの行を描き直させる
+            self._last_frame.pop(y, None)
 
     def draw_search_ui(self):
         """Draws the search/replace UI at the bottom of the screen."""
@@ -3763,19 +4486,22 @@ class Editor:
         search_label = "Search: "
         replace_label = "Replace: "
         
+        self._last_frame.pop(start_y, None)
+        self._last_frame.pop(start_y + 1, None)
+
         # 検索ボックス
-        self.safe_addstr(start_y, 0, " " * self.width, curses.color_pair(19))
-        self.safe_addstr(start_y, 0, search_label, curses.color_pair(19))
-        self.safe_addstr(start_y, len(search_label), self.search_query, curses.color_pair(19))
+        self.safe_addstr(start_y, 0, " " * self.width, self._PAIR[19])
+        self.safe_addstr(start_y, 0, search_label, self._PAIR[19])
+        self.safe_addstr(start_y, len(search_label), self.search_query, self._PAIR[19])
         if self.search_input_focused == "search":
-            self.safe_addstr(start_y, len(search_label) + len(self.search_query), "_", curses.color_pair(19) | curses.A_BLINK)
+            self.safe_addstr(start_y, len(search_label) + len(self.search_query), "_", self._PAIR[19] | curses.A_BLINK)
 
         # 置換ボックス
-        self.safe_addstr(start_y + 1, 0, " " * self.width, curses.color_pair(19))
-        self.safe_addstr(start_y + 1, 0, replace_label, curses.color_pair(19))
-        self.safe_addstr(start_y + 1, len(replace_label), self.replace_query, curses.color_pair(19))
+        self.safe_addstr(start_y + 1, 0, " " * self.width, self._PAIR[19])
+        self.safe_addstr(start_y + 1, 0, replace_label, self._PAIR[19])
+        self.safe_addstr(start_y + 1, len(replace_label), self.replace_query, self._PAIR[19])
         if self.search_input_focused == "replace":
-            self.safe_addstr(start_y + 1, len(replace_label) + len(self.replace_query), "_", curses.color_pair(19) | curses.A_BLINK)
+            self.safe_addstr(start_y + 1, len(replace_label) + len(self.replace_query), "_", self._PAIR[19] | curses.A_BLINK)
 
     def draw_ui(self):
         # Plugin Manager Mode doesn't use standard UI
@@ -3793,36 +4519,24 @@ class Editor:
         self.draw_breadcrumb()
 
         mark_status = "[MARK]" if self.mark_pos else ""
-        menu_lines = []
 
         if self.search_mode:
             self.draw_search_ui()
             self.menu_height = 0 # 検索UIが表示されている間はキーバインドヒントを非表示
         else:
-            current_line_text = ""
-            
+            # 折り返し結果は画面幅と表示するキー設定だけで決まるのでキャッシュする
             displayed_ids = self.config.get("displayed_keybindings", [])
-            
-            for binding_id in displayed_ids:
-                binding_info = DEFAULT_KEYBINDINGS.get(binding_id)
-                if not binding_info: continue
-
-                key_str = binding_info["key"]
-                label = binding_info["label"]
-                item_str = f"{key_str} {label}  "
-                if len(current_line_text) + len(item_str) > self.width:
-                    menu_lines.append(current_line_text)
-                    current_line_text = item_str
-                else:
-                    current_line_text += item_str
-            if current_line_text:
-                menu_lines.append(current_line_text)
+            menu_key = (self.width, tuple(displayed_ids))
+            if self._menu_cache is None or self._menu_cache[0] != menu_key:
+                self._menu_cache = (menu_key, self._build_menu_lines(displayed_ids))
+            menu_lines = self._menu_cache[1]
 
             self.menu_height = len(menu_lines)
             
             for i, line in enumerate(reversed(menu_lines)):
                 y = self.height - 1 - i
-                self.safe_addstr(y, 0, line.ljust(self.width), curses.color_pair(1))
+                if self._bar_unchanged(y, ("menu", self.width, line)): continue
+                self.safe_addstr(y, 0, line.ljust(self.width), self._PAIR[1])
 
         mod_char = " *" if self.modified else ""
         syntax_name = "Text"
@@ -3836,16 +4550,16 @@ class Editor:
         branch_info = f" ({self.git_branch})" if self.git_branch else ""
         header = f" {EDITOR_NAME} v{VERSION}{branch_info} | {self.filename or 'New Buffer'} {mod_char} | {syntax_name} | {focus_str} {mark_status}"
         header = header.ljust(self.width)
-        self.safe_addstr(1, 0, header, curses.color_pair(1) | curses.A_BOLD)
+        if not self._bar_unchanged(1, ("header", header)):
+            self.safe_addstr(1, 0, header, self._PAIR[1] | curses.A_BOLD)
         self.header_height = 1
         self.status_height = 1
 
         status_y = self.height - self.menu_height - 1
         
-        now = datetime.datetime.now()
         display_msg = ""
         if self.status_message:
-            if not self.status_expire_time or now <= self.status_expire_time:
+            if self.status_expire_time is None or time.monotonic() <= self.status_expire_time:
                 display_msg = self.status_message
             else:
                 self.status_message = ""
@@ -3860,21 +4574,55 @@ class Editor:
         max_msg_len = self.width - len(pos_info) - len(vim_status_str) - 1
         if len(display_msg) > max_msg_len:
             display_msg = display_msg[:max_msg_len]
+
+        if self._bar_unchanged(status_y, ("status", self.width, display_msg, pos_info, vim_status_str)):
+            return
             
-        self.safe_addstr(status_y, 0, " " * self.width, curses.color_pair(2))
-        self.safe_addstr(status_y, 0, display_msg, curses.color_pair(2))
+        self.safe_addstr(status_y, 0, " " * self.width, self._PAIR[2])
+        self.safe_addstr(status_y, 0, display_msg, self._PAIR[2])
         
         # Draw vim status then position
         right_status_x = self.width - len(pos_info)
-        self.safe_addstr(status_y, right_status_x, pos_info, curses.color_pair(1))
+        self.safe_addstr(status_y, right_status_x, pos_info, self._PAIR[1])
         
         if vim_status_str:
             right_status_x -= len(vim_status_str)
-            self.safe_addstr(status_y, right_status_x, vim_status_str, curses.color_pair(1))
+            self.safe_addstr(status_y, right_status_x, vim_status_str, self._PAIR[1])
+
+    def _bar_unchanged(self, y, sig):
+        """バー行 y の内容 sig が前フレームと同じなら True を返す（違えば記録して False）"""
+        if self._last_frame.get(y) == sig:
+            return True
+        self._last_frame[y] = sig
+        return False
+
+    def _build_menu_lines(self, displayed_ids):
+        """キーバインドのヒントを画面幅で折り返した行のリストを返す"""
+        menu_lines = []
+        current_line_text = ""
+        for binding_id in displayed_ids:
+            binding_info = DEFAULT_KEYBINDINGS.get(binding_id)
+            if not binding_info: continue
+
+            key_str = binding_info["key"]
+            label = binding_info["label"]
+            item_str = f"{key_str} {label}  "
+            if len(current_line_text) + len(item_str) > self.width:
+                menu_lines.append(current_line_text)
+                current_line_text = item_str
+            else:
+                current_line_text += item_str
+        if current_line_text:
+            menu_lines.append(current_line_text)
+        return menu_lines
 
     def draw_tab_bar(self):
         """Draws the tab bar at the top of the screen"""
-        self.safe_addstr(0, 0, " " * self.width, curses.color_pair(10))
+        sig = ("tabs", self.width, self.active_tab_idx,
+               tuple((tab.filename, tab.modified, tab.git_status) for tab in self.tabs))
+        if self._bar_unchanged(0, sig):
+            return
+        self.safe_addstr(0, 0, " " * self.width, self._PAIR[10])
         current_x = 0
         for i, tab in enumerate(self.tabs):
             name = os.path.basename(tab.filename) if tab.filename else "untitled"
@@ -3886,7 +4634,7 @@ class Editor:
 
             display = f" {i+1}:{name}{mod}{git_mod} "
             
-            pair = curses.color_pair(14) if i == self.active_tab_idx else curses.color_pair(15)
+            pair = self._PAIR[14] if i == self.active_tab_idx else self._PAIR[15]
             self.safe_addstr(0, current_x, display, pair)
             current_x += len(display)
             if current_x >= self.width: break
@@ -3913,8 +4661,11 @@ class Editor:
             breadcrumb_text += f" › {symbol}"
 
         # 描画属性を新しいカラーペアに設定
-        breadcrumb_attr = curses.color_pair(18)
+        breadcrumb_attr = self._PAIR[18]
         
+        if self._bar_unchanged(breadcrumb_y, ("crumb", self.width, breadcrumb_text)):
+            return
+
         # 背景をクリアし、テキストを描画
         self.safe_addstr(breadcrumb_y, 0, " " * self.width, breadcrumb_attr)
         self.safe_addstr(breadcrumb_y, 0, f" {truncate_to_width(breadcrumb_text, self.width - 2)}", breadcrumb_attr)
@@ -3942,7 +4693,7 @@ class Editor:
 
         # 横スクロール調整 (nano風: カーソルが画面端に行くとスクロール)
         edit_w = self.get_edit_rect()[3]
-        linenum_width = max(4, len(str(len(self.buffer)))) + 1
+        linenum_width = self.get_linenum_width()
         actual_edit_w = edit_w - linenum_width
 
         if self.cursor_x < self.col_offset:
@@ -4071,10 +4822,11 @@ class Editor:
         self.mark_pos = None
 
     def perform_cut(self):
-        self.save_history()
         sel = self.get_selection_range()
         if not sel:
             if len(self.buffer) > 0:
+                self._push_undo(self.cursor_y, self.cursor_y)
+                self._hl_invalidate(self.cursor_y, -1)
                 line_content = self.buffer.lines.pop(self.cursor_y)
                 if not self.buffer.lines: self.buffer.lines = [""]
                 self.move_cursor(self.cursor_y, 0)
@@ -4083,8 +4835,10 @@ class Editor:
                 self._update_clipboard([line_content], is_line=True)
             return
 
+        self._push_undo(sel[0][0], sel[1][0])
         self.perform_copy()
         start, end = sel
+        self._hl_invalidate(start[0], start[0] - end[0])
         if start[0] == end[0]:
             line = self.buffer.lines[start[0]]
             self.buffer.lines[start[0]] = line[:start[1]] + line[end[1]:]
@@ -4106,7 +4860,8 @@ class Editor:
             self.status_message = "Clipboard empty."
             return
         
-        self.save_history()
+        self._push_undo(self.cursor_y, self.cursor_y)
+        self._hl_invalidate(self.cursor_y, len(self.clipboard) - 1)
         current_line = self.buffer.lines[self.cursor_y]
         prefix = current_line[:self.cursor_x]
         suffix = current_line[self.cursor_x:]
@@ -4116,10 +4871,9 @@ class Editor:
             self.buffer.lines[self.cursor_y] = new_line
             self.move_cursor(self.cursor_y, self.cursor_x + len(self.clipboard[0]), update_desired_x=True)
         else:
-            self.buffer.lines[self.cursor_y] = prefix + self.clipboard[0]
-            for i in range(1, len(self.clipboard) - 1):
-                self.buffer.lines.insert(self.cursor_y + i, self.clipboard[i])
-            self.buffer.lines.insert(self.cursor_y + len(self.clipboard) - 1, self.clipboard[-1] + suffix)
+            middle = _intern_lines(self.clipboard[1:-1])
+            self.buffer.lines[self.cursor_y:self.cursor_y + 1] = (
+                [prefix + self.clipboard[0]] + middle + [self.clipboard[-1] + suffix])
             new_y = self.cursor_y + len(self.clipboard) - 1
             new_x = len(self.clipboard[-1])
             self.move_cursor(new_y, new_x, update_desired_x=True)
@@ -4153,8 +4907,9 @@ class Editor:
     def _insert_text_at_cursor(self, text):
         """カーソル位置にテキストを挿入する（自動インデントなし）"""
         if not text: return
-        self.save_history()
+        self._push_undo(self.cursor_y, self.cursor_y)
         lines = text.split('\n')
+        self._hl_invalidate(self.cursor_y, len(lines) - 1)
         
         current_line = self.buffer.lines[self.cursor_y]
         prefix = current_line[:self.cursor_x]
@@ -4164,10 +4919,7 @@ class Editor:
             self.buffer.lines[self.cursor_y] = prefix + lines[0] + suffix
             self.move_cursor(self.cursor_y, self.cursor_x + len(lines[0]), update_desired_x=True)
         else:
-            self.buffer.lines[self.cursor_y] = prefix + lines[0]
-            for i in range(1, len(lines) - 1):
-                self.buffer.lines.insert(self.cursor_y + i, lines[i])
-            self.buffer.lines.insert(self.cursor_y + len(lines) - 1, lines[-1] + suffix)
+            self.buffer.lines[self.cursor_y:self.cursor_y + 1] = [prefix + lines[0]] + lines[1:-1] + [lines[-1] + suffix]
             self.move_cursor(self.cursor_y + len(lines) - 1, len(lines[-1]), update_desired_x=True)
             
         self.modified = True
@@ -4194,7 +4946,6 @@ class Editor:
                 self.current_tab.current_syntax_rules["line_comment"] = symbol
             rules = self.current_tab.current_syntax_rules
 
-        self.save_history()
         sel = self.get_selection_range()
         if sel:
             start, end = sel
@@ -4204,13 +4955,15 @@ class Editor:
                 end_y -= 1
         else:
             start_y = end_y = self.cursor_y
+        self._push_undo(start_y, end_y)
 
         # Determine if we should comment or uncomment
         # Logic: if any line is NOT commented, comment all. Else uncomment all.
-        pattern = re.compile(r'^\s*' + re.escape(symbol))
+        # 行頭の空白を lstrip で飛ばし、その直後がコメント記号かどうかを見る（正規表現は使わない）
         any_not_commented = False
         for y in range(start_y, end_y + 1):
-            if not pattern.match(self.buffer.lines[y]) and self.buffer.lines[y].strip():
+            stripped = self.buffer.lines[y].lstrip()
+            if stripped and not stripped.startswith(symbol):
                 any_not_commented = True
                 break
         
@@ -4218,20 +4971,17 @@ class Editor:
             line = self.buffer.lines[y]
             if not line.strip(): continue # Skip empty lines
 
+            indent_len = len(line) - len(line.lstrip())
             if any_not_commented:
                 # Commenting: insert symbol after leading whitespace
-                m = re.match(r'^(\s*)', line)
-                indent_len = len(m.group(1)) if m else 0
                 self.buffer.lines[y] = line[:indent_len] + symbol + line[indent_len:]
                 if y == self.cursor_y and self.cursor_x >= indent_len:
                     self.cursor_x += len(symbol)
             else:
                 # Uncommenting: remove symbol
-                match = pattern.match(line)
-                if match:
-                    # Find where the symbol actually starts (match.end() - len(symbol))
-                    symbol_start = match.end() - len(symbol)
-                    self.buffer.lines[y] = line[:symbol_start] + line[match.end():]
+                if line.startswith(symbol, indent_len):
+                    symbol_start = indent_len
+                    self.buffer.lines[y] = line[:symbol_start] + line[symbol_start + len(symbol):]
                     if y == self.cursor_y and self.cursor_x > symbol_start:
                         self.cursor_x = max(symbol_start, self.cursor_x - len(symbol))
         
@@ -4241,21 +4991,24 @@ class Editor:
 
     def delete_line(self):
         if not self.buffer.lines: return
-        self.save_history()
+        self._push_undo(self.cursor_y, self.cursor_y)
         if len(self.buffer.lines) > 1:
             del self.buffer.lines[self.cursor_y]
+            self._hl_invalidate(self.cursor_y, -1)
             self.move_cursor(self.cursor_y, 0)
         elif self.buffer.lines and len(self.buffer.lines[0]) > 0:
              self.buffer.lines[0] = ""
+             self._hl_invalidate(0)
              self.move_cursor(0, 0)
         self.modified = True
         self.status_message = "Deleted line."
 
     def set_status(self, msg, timeout=3):
         self.status_message = msg
+        # 期限は time.monotonic() 基準の秒数（timeout=None なら消えない）
         try:
-            self.status_expire_time = datetime.datetime.now() + datetime.timedelta(seconds=timeout)
-        except Exception:
+            self.status_expire_time = time.monotonic() + timeout
+        except TypeError:
             self.status_expire_time = None
 
     def save_file(self):
@@ -4268,7 +5021,12 @@ class Editor:
                 return
 
         try:
-            if os.path.exists(self.filename):
+            # 既存ファイルの有無と権限を1回の stat で調べる
+            try:
+                old_stat = os.stat(self.filename)
+            except OSError:
+                old_stat = None
+            if old_stat is not None:
                 try:
                     setting_dir = get_config_dir()
                     backup_subdir = self.config.get("backup_subdir", "backup")
@@ -4281,23 +5039,63 @@ class Editor:
                     timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
                     bak_name = os.path.join(backup_dir, f"{safe_filename}.{timestamp}.bak")
 
-                    shutil.copy2(self.filename, bak_name)
+                    # 保存は一時ファイルを rename で差し替えるので、今の inode はそのままバックアップとして残せる。
+                    # 同じファイルシステムならハードリンクで済ませ、だめならコピーする
+                    try:
+                        os.link(self.filename, bak_name)
+                    except (OSError, AttributeError):
+                        _clone_file(self.filename, bak_name)
 
                     backup_limit = self.config.get("backup_count", 5)
-                    backup_pattern = os.path.join(backup_dir, f"{safe_filename}.*.bak")
-                    existing_backups = sorted(glob.glob(backup_pattern))
+                    # <safe_filename>.<タイムスタンプ>.bak を1回の走査で集める
+                    # （名前の辞書順 = 時刻順なので、古いものだけを部分ソートで選ぶ）
+                    prefix = f"{safe_filename}."
+                    with os.scandir(backup_dir) as it:
+                        existing_backups = [e.name for e in it
+                                            if e.name.startswith(prefix) and e.name.endswith(".bak")
+                                            and len(e.name) >= len(prefix) + 4]
 
                     if len(existing_backups) > backup_limit:
-                        for old_backup in existing_backups[:-backup_limit]:
-                            try: os.remove(old_backup)
+                        for old_backup in heapq.nsmallest(len(existing_backups) - backup_limit, existing_backups):
+                            try: os.remove(os.path.join(backup_dir, old_backup))
                             except OSError: pass
                 except (IOError, OSError) as e:
                     self.set_status(f"Backup warning: {e}", timeout=4)
 
-            tmp_name = f"{self.filename}.tmp"
-            with open(tmp_name, 'w', encoding='utf-8') as f:
-                f.write("\n".join(self.buffer.lines))
-            os.replace(tmp_name, self.filename)
+            # 一時ファイル名はプロセスごとに一意にする（同時保存での衝突を防ぐ）
+            fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(self.filename) or '.',
+                                            prefix='.caffee.', suffix='.tmp')
+            try:
+                # mkstemp は 0600 で作るので、元ファイル（無ければ umask）の権限に合わせる
+                if old_stat is not None:
+                    mode = stat.S_IMODE(old_stat.st_mode)
+                else:
+                    umask = os.umask(0)
+                    os.umask(umask)
+                    mode = 0o666 & ~umask
+                if hasattr(os, 'fchmod'):
+                    os.fchmod(fd, mode)
+                with os.fdopen(fd, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                    # 全体を1つの文字列にせず、一定行数ずつ連結して書き出す
+                    lines = self.buffer.lines
+                    for i in range(0, len(lines), _SAVE_CHUNK_LINES):
+                        if i: f.write("\n")
+                        f.write("\n".join(lines[i:i + _SAVE_CHUNK_LINES]))
+                    # rename より先に内容をディスクに書き出す（クラッシュ時に空ファイルが残らないように）
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_name, self.filename)
+            except BaseException:
+                try: os.remove(tmp_name)
+                except OSError: pass
+                raise
+            # rename 自体もディレクトリを fsync して確定させる（Windows などでは開けないので省く）
+            try:
+                dir_fd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+                try: os.fsync(dir_fd)
+                finally: os.close(dir_fd)
+            except OSError:
+                pass
             
             try: 
                 self.file_mtime = os.path.getmtime(self.filename)
@@ -4326,7 +5124,7 @@ class Editor:
             self.set_status("Selection cleared.", timeout=2)
         else:
             last_y = len(self.buffer) - 1
-            last_x = len(self.buffer[last_y]) if self.buffer.lines else 0
+            last_x = len(self.buffer[last_y]) if len(self.buffer) else 0
             self.mark_pos = (0, 0)
             self.move_cursor(last_y, last_x, update_desired_x=True)
             self.set_status("Selected all.", timeout=2)
@@ -4440,13 +5238,13 @@ class Editor:
                 return
 
         # 新しいタブで開く
-        new_lines, err = self.load_file(filename)
+        new_buffer, err = self._load_buffer(filename)
         if not err:
             mtime = None
             try: mtime = os.path.getmtime(filename)
             except OSError: pass
             rules = self.detect_syntax(filename)
-            new_tab = EditorTab(Buffer(new_lines), filename, rules, mtime)
+            new_tab = EditorTab(new_buffer, filename, rules, mtime)
             self._update_tab_git_status(new_tab)
             self.tabs.append(new_tab)
             self.active_tab_idx = len(self.tabs) - 1
@@ -4556,7 +5354,6 @@ class Editor:
         """'delcomm' command: Delete all comments in the current buffer."""
         if not self.buffer.lines: return
 
-        self.save_history()
         rules = self.current_syntax_rules
         
         # We try to use the 'comments' regex if available
@@ -4600,8 +5397,18 @@ class Editor:
             
         if not new_lines:
             new_lines = [""]
-            
-        self.buffer.lines = new_lines
+
+        # 変わった範囲（前後の同じ行を除く）だけを履歴に記録して置き換える
+        lines = self.buffer.lines
+        lo, n = 0, min(len(lines), len(new_lines))
+        while lo < n and lines[lo] == new_lines[lo]: lo += 1
+        k = 0
+        while k < n - lo and lines[-1 - k] == new_lines[-1 - k]: k += 1
+        if lo < len(lines) - k or lo < len(new_lines) - k:
+            self._push_undo(lo, len(lines) - 1 - k)
+            self._hl_invalidate(lo, len(new_lines) - len(lines))
+            lines[lo:len(lines) - k] = new_lines[lo:len(new_lines) - k]
+            self.move_cursor(self.cursor_y, self.cursor_x)
         self.modified = True
         self.set_status(f"Deleted comments from {count} lines.", timeout=3)
 
@@ -4623,6 +5430,15 @@ class Editor:
             # if result is False, a tab was closed, but more remain.
             # The loop will continue.
     
+    def _command_hl(self, state=None, *args):
+        """'hl'コマンド: 現在のタブのシンタックスハイライトを切り替える"""
+        tab = self.current_tab
+        if state is None:
+            tab.hl_enabled = not tab.hl_enabled
+        else:
+            tab.hl_enabled = state.lower() in ['on', 'true', '1', 'yes']
+        self.set_status(f"Highlighting {'enabled' if tab.hl_enabled else 'disabled'}.", timeout=3)
+
     def _command_new(self):
         """'new'コマンド: 新しい空のタブを作成"""
         self.new_tab()
@@ -4711,14 +5527,13 @@ class Editor:
             return
 
         # Scan buffer for suggestions
-        candidates = set()
         # \b is word boundary, re.escape escapes special characters in the word
         pattern = re.compile(r'\b' + re.escape(current_word) + r'\w*\b')
-        for buffer_line in self.buffer.lines:
-            for match in pattern.finditer(buffer_line):
-                # 自分自身は候補に含めない
-                if match.group(0) != current_word:
-                    candidates.add(match.group(0))
+        # 行ごとに Python で回さず、全行を連結して一度に走査する
+        # （\w と \b は改行をまたがないので結果は行ごとの走査と同じ）
+        candidates = set(pattern.findall("\n".join(self.buffer.lines)))
+        # 自分自身は候補に含めない
+        candidates.discard(current_word)
         
         # Sort and limit suggestions
         sorted_candidates = sorted(list(candidates))
@@ -4755,7 +5570,7 @@ class Editor:
             
         text_to_insert = selected_suggestion[len(current_word):]
         
-        self.save_history()
+        self._push_undo(y, y)
         
         # 単語の残りを挿入
         prefix = line[:self.cursor_x]
@@ -4773,393 +5588,499 @@ class Editor:
 
     # -----------------------------
 
-    def main_loop(self):
-        while not self.should_exit:
+    def _drain_printable(self, first):
+        """入力キューに溜まっている通常文字を読み出して first に連結する。
+        制御キーが来たらキューに戻して止める（ペースト・高速入力の一括処理用）"""
+        chars = [first]
+        self.stdscr.nodelay(True)
+        try:
+            while True:
+                try:
+                    ch = self.stdscr.get_wch()
+                except curses.error:
+                    break
+                if isinstance(ch, str) and len(ch) == 1 and ch not in _CONTROL_CHARS:
+                    chars.append(ch)
+                    continue
+                try:
+                    if isinstance(ch, str): curses.unget_wch(ch)
+                    else: curses.ungetch(ch)
+                except curses.error: pass
+                break
+        finally:
+            self.stdscr.nodelay(False)
+        return "".join(chars)
+
+    def _type_text(self, first):
+        """通常文字の入力。既に届いている文字はまとめて1回で挿入する（履歴・再描画も1回）"""
+        text = self._drain_printable(first)
+        self._push_typing_undo()
+        line = self.buffer.lines[self.cursor_y]
+        self.buffer.lines[self.cursor_y] = line[:self.cursor_x] + text + line[self.cursor_x:]
+        self.move_cursor(self.cursor_y, self.cursor_x + len(text), update_desired_x=True)
+        self._end_typing_undo()
+        self.modified = True
+        self._update_suggestions()
+
+    def _input_ready(self):
+        """端末からの入力がすでに届いているか（待たずに調べる）"""
+        try:
+            return bool(select.select([sys.stdin], [], [], 0)[0])
+        except (OSError, ValueError):
+            return False
+
+    def _render_frame(self):
+        """画面全体を描き、カーソルを置く（実際の出力は次の get_wch でまとめて行われる）"""
+        self.height, self.width = self.stdscr.getmaxyx()
+        # レイアウトが変わった時だけ画面全体を消去する（編集領域は行単位で差分描画）
+        layout = (self.height, self.width, self.active_pane, self.show_explorer, self.show_terminal,
+                  self.search_mode, self.menu_height, self.active_tab_idx)
+        if self._frame_dirty or layout != self._frame_layout or self.active_pane not in ('editor', 'explorer', 'terminal'):
             self.stdscr.erase()
-            self.height, self.width = self.stdscr.getmaxyx()
+            self._last_frame = {}
+            self._frame_layout = layout
+            self._frame_dirty = False
+        
+        self.draw_ui()
+        self.draw_content()
+        self._draw_suggestions()
+        
+        if self.active_pane == 'editor':
+            linenum_width = self.get_linenum_width()
+            edit_y, edit_x, _, _ = self.get_edit_rect()
+            screen_y = self.cursor_y - self.scroll_offset + edit_y
             
-            if self.filename and os.path.exists(self.filename):
-                try:
-                    mtime = os.path.getmtime(self.filename)
-                    if self.file_mtime and mtime != self.file_mtime:
-                        self.set_status("File changed on disk.", timeout=5)
-                        self.file_mtime = mtime
-                except OSError:
-                    pass
+            # カーソル表示位置の計算（横スクロール考慮）
+            screen_x = edit_x + linenum_width
             
-            if self.show_terminal and self.terminal:
-                if self.terminal.read_output():
-                    pass
-
-            self.draw_ui()
-            self.draw_content()
-            self._draw_suggestions()
+            # col_offset（左端）からcursor_xまでの文字幅を計算して加算
+            if self.cursor_y < len(self.buffer):
+                # col_offsetより左にある場合は画面外なので計算しない（ただしロジック上はmove_cursorでクランプされているはず）
+                # cursor_xがcol_offset以上のときのみ描画位置を計算
+                if self.cursor_x >= self.col_offset:
+                    screen_x += self._cursor_display_offset()
             
-            if self.active_pane == 'editor':
-                linenum_width = max(4, len(str(len(self.buffer)))) + 1
-                edit_y, edit_x, _, _ = self.get_edit_rect()
-                screen_y = self.cursor_y - self.scroll_offset + edit_y
-                
-                # カーソル表示位置の計算（横スクロール考慮）
-                screen_x = edit_x + linenum_width
-                
-                # col_offset（左端）からcursor_xまでの文字幅を計算して加算
-                if self.cursor_y < len(self.buffer):
-                    # col_offsetより左にある場合は画面外なので計算しない（ただしロジック上はmove_cursorでクランプされているはず）
-                    # cursor_xがcol_offset以上のときのみ描画位置を計算
-                    if self.cursor_x >= self.col_offset:
-                        visible_segment = self.buffer.lines[self.cursor_y][self.col_offset : self.cursor_x]
-                        for char in visible_segment:
-                            screen_x += get_char_width(char)
-                
-                edit_height = self.get_edit_height()
-                if edit_y <= screen_y < edit_y + edit_height:
-                    try: self.stdscr.move(screen_y, min(screen_x, self.width - 1))
-                    except curses.error: pass
-                curses.curs_set(1)
-            elif self.active_pane == 'explorer':
-                curses.curs_set(0)
-            elif self.active_pane == 'terminal':
-                ty, tx, th, tw = self.get_terminal_rect()
-                try: self.stdscr.move(ty + th - 1, tx + 2)
+            edit_height = self.get_edit_height()
+            if edit_y <= screen_y < edit_y + edit_height:
+                try: self.stdscr.move(screen_y, min(screen_x, self.width - 1))
                 except curses.error: pass
-                curses.curs_set(1)
-            elif self.active_pane == 'plugin_manager':
-                curses.curs_set(0)
-            elif self.active_pane == 'settings_manager':
-                curses.curs_set(0)
-            elif self.active_pane == 'keybinding_settings':
-                curses.curs_set(0)
-            elif self.active_pane == 'full_screen_explorer':
-                curses.curs_set(0)
+            curses.curs_set(1)
+        elif self.active_pane == 'explorer':
+            curses.curs_set(0)
+        elif self.active_pane == 'terminal':
+            ty, tx, th, tw = self.get_terminal_rect()
+            try: self.stdscr.move(ty + th - 1, tx + 2)
+            except curses.error: pass
+            curses.curs_set(1)
+        elif self.active_pane == 'plugin_manager':
+            curses.curs_set(0)
+        elif self.active_pane == 'settings_manager':
+            curses.curs_set(0)
+        elif self.active_pane == 'keybinding_settings':
+            curses.curs_set(0)
+        elif self.active_pane == 'full_screen_explorer':
+            curses.curs_set(0)
+        self._last_render = time.monotonic()
+
+    def _toggle_search_mode(self):
+        self.search_mode = not self.search_mode
+        if self.search_mode:
+            self.search_input_focused = "search"
+        else:
+            self.search_results = []
+            self.active_search_idx = -1
 
-            try:
-                if self.show_terminal:
-                    self.stdscr.timeout(50) 
-                else:
-                    self.stdscr.timeout(100)
-                    
-                key_in = self.stdscr.get_wch()
-                self.stdscr.timeout(-1)
-                
-                # ブラケットペースト開始シーケンス \x1b[200~ の検知
-                if key_in == '\x1b' or key_in == 27:
-                    self.stdscr.nodelay(True)
-                    paste_detected = False
-                    consumed = []
-                    try:
-                        seq = ""
-                        for _ in range(5):
-                            ch = self.stdscr.get_wch()
-                            consumed.append(ch)
-                            if isinstance(ch, str):
-                                seq += ch
-                            else:
-                                break
-                            
-                            if seq == "[200~":
-                                self._handle_bracketed_paste()
-                                paste_detected = True
-                                break
-                            elif not "[200~".startswith(seq):
-                                break
-                    except curses.error:
-                        pass
-                    
-                    self.stdscr.nodelay(False)
-                    if paste_detected:
-                        continue
-                    else:
-                        # 読みすぎた文字をキューに戻す
-                        for ch in reversed(consumed):
-                            try: curses.unget_wch(ch)
-                            except curses.error: pass
+    def _toggle_mark(self):
+        if self.mark_pos: 
+            self.mark_pos = None
+            self.set_status("Mark Unset", timeout=2)
+        else: 
+            self.mark_pos = (self.cursor_y, self.cursor_x)
+            self.set_status("Mark Set", timeout=2)
+
+    def _key_up(self):
+        if self.suggestion_active:
+            self.selected_suggestion_idx = (self.selected_suggestion_idx - 1 + len(self.suggestions)) % len(self.suggestions)
+        else:
+            self.move_cursor(self.cursor_y - 1, self.desired_x)
 
-            except KeyboardInterrupt:
-                key_in = CTRL_C
-            except curses.error: 
-                key_in = -1
-            
-            key_code = -1
-            char_input = None
+    def _key_down(self):
+        if self.suggestion_active:
+            self.selected_suggestion_idx = (self.selected_suggestion_idx + 1) % len(self.suggestions)
+        else:
+            self.move_cursor(self.cursor_y + 1, self.desired_x)
 
-            if isinstance(key_in, int):
-                key_code = key_in
-            elif isinstance(key_in, str):
-                if len(key_in) == 1:
-                    code = ord(key_in)
-                    if code < 32 or code == 127:
-                        key_code = code
-                    else:
-                        char_input = key_in
-            
-            if key_code == -1 and char_input is None: continue
+    def _key_left(self):
+        self.suggestion_active = False
+        self.move_cursor(self.cursor_y, self.cursor_x - 1, update_desired_x=True)
 
-            if key_code == CTRL_F:
-                self.toggle_explorer()
-                continue
-            elif key_code == CTRL_N:
-                self.toggle_terminal()
-                continue
-            elif key_code == CTRL_T:
-                self._select_and_insert_template()
-                continue
-            elif key_code == CTRL_B:
-                self.run_build_command()
-                continue
-            elif key_code == CTRL_S:
-                self.new_tab()
-                continue
-            elif key_code == CTRL_V:
-                self.perform_paste()
-                continue
-            elif key_code == CTRL_L:
-                self.next_tab()
-                continue
+    def _key_right(self):
+        self.suggestion_active = False
+        self.move_cursor(self.cursor_y, self.cursor_x + 1, update_desired_x=True)
+
+    def _key_line_start(self):
+        self.suggestion_active = False
+        self.move_cursor(self.cursor_y, 0, update_desired_x=True)
+
+    def _key_line_end(self):
+        self.suggestion_active = False
+        self.move_cursor(self.cursor_y, len(self.buffer[self.cursor_y]), update_desired_x=True)
 
+    def _key_page_up(self):
+        self.suggestion_active = False
+        self.move_cursor(self.cursor_y - self.get_edit_height(), self.cursor_x, update_desired_x=True)
+
+    def _key_page_down(self):
+        self.suggestion_active = False
+        self.move_cursor(self.cursor_y + self.get_edit_height(), self.cursor_x, update_desired_x=True)
+
+    # どの画面（ペイン）にいても先に処理するキー（キーコード -> メソッド名）
+    _GLOBAL_KEY_HANDLERS = {
+        CTRL_F: "toggle_explorer", CTRL_N: "toggle_terminal",
+        CTRL_T: "_select_and_insert_template", CTRL_B: "run_build_command",
+        CTRL_S: "new_tab", CTRL_V: "perform_paste", CTRL_L: "next_tab",
+    }
+
+    # エディタ画面で引数なしのメソッド1つで処理できるキー（キーコード -> メソッド名）。
+    # 名前で引くのでプラグインがインスタンスのメソッドを差し替えても効く
+    _KEY_HANDLERS = {
+        CTRL_D: "show_diff", CTRL_C: "perform_copy", CTRL_O: "save_file",
+        CTRL_W: "_toggle_search_mode", CTRL_MARK: "_toggle_mark",
+        CTRL_G: "goto_line", CTRL_A: "select_all",
+        CTRL_Q: "_key_line_start", CTRL_E: "_key_line_end",
+        CTRL_SLASH: "toggle_comment", CTRL_Y: "delete_line", CTRL_P: "enter_command_mode",
+        CTRL_K: "perform_cut", CTRL_U: "toggle_relative_linenum",
+        CTRL_Z: "undo", CTRL_R: "redo",
+        curses.KEY_UP: "_key_up", curses.KEY_DOWN: "_key_down",
+        curses.KEY_LEFT: "_key_left", curses.KEY_RIGHT: "_key_right",
+        curses.KEY_HOME: "_key_line_start", curses.KEY_END: "_key_line_end",
+        curses.KEY_PPAGE: "_key_page_up", curses.KEY_NPAGE: "_key_page_down",
+    }
+
+    def _file_check_due(self):
+        """開いているファイルの外部変更を確認すべきか。
+        watchdog で監視できていればイベントが来た時だけ、そうでなければ一定間隔ごとに True"""
+        if self.filename != self._watch_target:
+            # ファイル（タブ）が切り替わったら監視先を合わせ、一度は確認する
+            self._watch_target = self.filename
+            self._watch_path = os.path.abspath(self.filename) if self.filename else None
+            self._watch_active = bool(self._watch_path and self._file_watcher and
+                                      self._file_watcher.watch(self._watch_path))
+            if self._watch_active:
+                return True
+        if self._watch_active:
+            return self._file_watcher.pop_changed()
+        # キー入力ごとに stat しないよう、一定間隔ごとにだけ確認する
+        now = time.monotonic()
+        if now - self._last_mtime_check >= self.config.get("file_check_interval", 2):
+            self._last_mtime_check = now
+            return True
+        return False
+
+    def _input_timeout_ms(self):
+        """次のキー入力を待ってよい時間（ミリ秒、-1 は無期限）。
+        端末の出力・ファイルの確認・ステータスの消去が必要になる時刻までだけ待つ"""
+        if self.show_terminal and self.terminal:
+            return 50
+        deadlines = []
+        if self.status_message and self.status_expire_time is not None:
+            deadlines.append(self.status_expire_time)
+        if self.filename:
+            interval = self.config.get("file_check_interval", 2)
+            # watchdog のイベントは入力待ちを起こさないので、その場合も同じ間隔で確認する
+            deadlines.append(time.monotonic() + interval if self._watch_active
+                             else self._last_mtime_check + interval)
+        if not deadlines:
+            return -1
+        return max(0, int((min(deadlines) - time.monotonic()) * 1000) + 1)
+
+    def main_loop(self):
+        # 前回の入力待ちが何も起きずに時間切れになったか（その場合は変化がなければ描き直さない）
+        idle = False
+        try:
+            while not self.should_exit:
+                if self.filename and self._file_check_due():
+                    # 存在確認と更新時刻の取得を1回の stat で済ませる（無ければ OSError）
+                    try:
+                        mtime = os.stat(self.filename).st_mtime
+                        if self.file_mtime and mtime != self.file_mtime:
+                            self.set_status("File changed on disk.", timeout=5)
+                            self.file_mtime = mtime
+                            idle = False
+                    except OSError:
+                        pass
             
-            # --- Handle Plugin Manager Input ---
-            if self.active_pane == 'plugin_manager':
-                if key_code == curses.KEY_UP:
-                    self.plugin_manager.navigate(-1)
-                elif key_code == curses.KEY_DOWN:
-                    self.plugin_manager.navigate(1)
-                elif key_code in (KEY_ENTER, KEY_RETURN, ord(' ')):
-                    msg = self.plugin_manager.toggle_current()
-                    if msg: self.set_status(msg, timeout=4)
-                elif key_code == KEY_ESC:
-                    self.active_pane = 'editor'
-                continue
+                if self.show_terminal and self.terminal:
+                    if self.terminal.read_output():
+                        idle = False
+
+                # ステータスメッセージの期限切れも画面の変化になる
+                if idle and self.status_message and self.status_expire_time is not None and time.monotonic() > self.status_expire_time:
+                    idle = False
+
+                # キー入力が続けて届いている間は描画を省いて先に処理する（一定間隔では必ず描く）
+                if not idle and (self._pending_plugins or not self._input_ready()
+                                 or time.monotonic() - self._last_render > 0.05):
+                    self._render_frame()
+
+                # 最初のフレームを表示してからプラグインを読み込み、すぐに描き直す
+                if self._pending_plugins:
+                    self.stdscr.refresh()
+                    self._load_pending_plugins()
+                    continue
 
-            # --- Handle Keybinding Settings Input ---
-            if self.active_pane == 'keybinding_settings':
-                if key_code == curses.KEY_UP:
-                    self.keybinding_settings_manager.navigate(-1)
-                elif key_code == curses.KEY_DOWN:
-                    self.keybinding_settings_manager.navigate(1)
-                elif key_code in (KEY_ENTER, KEY_RETURN, ord(' ')):
-                    msg = self.keybinding_settings_manager.toggle_current()
-                    if msg: self.set_status(msg, timeout=3)
-                elif key_code == KEY_ESC:
-                    self.active_pane = 'settings_manager' # Go back to the main settings
-                continue
+                idle = False
+                try:
+                    self.stdscr.timeout(self._input_timeout_ms())
+                    key_in = self.stdscr.get_wch()
+                    self.stdscr.timeout(-1)
+                
+                    # ブラケットペースト開始シーケンス \x1b[200~ の検知
+                    if key_in == '\x1b' or key_in == 27:
+                        self.stdscr.nodelay(True)
+                        paste_detected = False
+                        consumed = []
+                        try:
+                            seq = ""
+                            for _ in range(5):
+                                ch = self.stdscr.get_wch()
+                                consumed.append(ch)
+                                if isinstance(ch, str):
+                                    seq += ch
+                                else:
+                                    break
+                            
+                                if seq == "[200~":
+                                    self._handle_bracketed_paste()
+                                    paste_detected = True
+                                    break
+                                elif not "[200~".startswith(seq):
+                                    break
+                        except curses.error:
+                            pass
+                    
+                        self.stdscr.nodelay(False)
+                        if paste_detected:
+                            continue
+                        else:
+                            # 読みすぎた文字をキューに戻す
+                            for ch in reversed(consumed):
+                                try: curses.unget_wch(ch)
+                                except curses.error: pass
+
+                except KeyboardInterrupt:
+                    key_in = CTRL_C
+                except curses.error: 
+                    key_in = -1
+                    idle = True
+            
+                key_code = -1
+                char_input = None
+
+                if isinstance(key_in, int):
+                    key_code = key_in
+                elif isinstance(key_in, str):
+                    if len(key_in) == 1:
+                        if key_in in _CONTROL_CHARS:
+                            key_code = ord(key_in)
+                        else:
+                            char_input = key_in
+            
+                if key_code == -1 and char_input is None: continue
 
-            # --- Handle Settings Manager Input ---
-            if self.active_pane == 'settings_manager':
-                if self.settings_manager.edit_mode:
-                    if key_code in (KEY_ENTER, KEY_RETURN, KEY_ESC, KEY_BACKSPACE, KEY_BACKSPACE2) or (char_input and ord(char_input) >= 32):
-                       res = self.settings_manager.handle_edit_input(key_code if key_code != -1 else ord(char_input))
-                       if res: self.set_status(res, timeout=3)
-                else:
+                # どの画面でも効くキー
+                handler = self._GLOBAL_KEY_HANDLERS.get(key_code)
+                if handler is not None:
+                    getattr(self, handler)()
+                    continue
+            
+                # --- Handle Plugin Manager Input ---
+                if self.active_pane == 'plugin_manager':
                     if key_code == curses.KEY_UP:
-                        self.settings_manager.navigate(-1)
+                        self.plugin_manager.navigate(-1)
                     elif key_code == curses.KEY_DOWN:
-                        self.settings_manager.navigate(1)
-                    elif key_code in (KEY_ENTER, KEY_RETURN):
-                        self.settings_manager.start_edit(self)
-                    elif key_code == ord(' '):
-                        res = self.settings_manager.toggle_bool()
-                        if res: self.set_status(res, timeout=3)
-                    elif key_code == CTRL_O:
-                        res = self.settings_manager.save_settings()
-                        self.set_status(res, timeout=3)
-                        # Ask to reload
-                        if self._prompt_for_confirmation("Reload config to apply changes now? (y/n)"):
-                            self.reload_config()
-
+                        self.plugin_manager.navigate(1)
+                    elif key_code in (KEY_ENTER, KEY_RETURN, ord(' ')):
+                        msg = self.plugin_manager.toggle_current()
+                        if msg: self.set_status(msg, timeout=4)
                     elif key_code == KEY_ESC:
                         self.active_pane = 'editor'
-                continue
-            
-            if self.active_pane == 'full_screen_explorer':
-                self._process_explorer_input(key_code, char_input)
-                continue
-            # -----------------------------------
+                    continue
 
-            if self.active_pane == 'explorer':
-                self._process_explorer_input(key_code, char_input)
-                continue
+                # --- Handle Keybinding Settings Input ---
+                if self.active_pane == 'keybinding_settings':
+                    if key_code == curses.KEY_UP:
+                        self.keybinding_settings_manager.navigate(-1)
+                    elif key_code == curses.KEY_DOWN:
+                        self.keybinding_settings_manager.navigate(1)
+                    elif key_code in (KEY_ENTER, KEY_RETURN, ord(' ')):
+                        msg = self.keybinding_settings_manager.toggle_current()
+                        if msg: self.set_status(msg, timeout=3)
+                    elif key_code == KEY_ESC:
+                        self.active_pane = 'settings_manager' # Go back to the main settings
+                    continue
 
-            if self.search_mode:
-                self._process_search_input(key_code, char_input)
-                continue
+                # --- Handle Settings Manager Input ---
+                if self.active_pane == 'settings_manager':
+                    if self.settings_manager.edit_mode:
+                        if key_code in (KEY_ENTER, KEY_RETURN, KEY_ESC, KEY_BACKSPACE, KEY_BACKSPACE2) or (char_input and ord(char_input) >= 32):
+                           res = self.settings_manager.handle_edit_input(key_code if key_code != -1 else ord(char_input))
+                           if res: self.set_status(res, timeout=3)
+                    else:
+                        if key_code == curses.KEY_UP:
+                            self.settings_manager.navigate(-1)
+                        elif key_code == curses.KEY_DOWN:
+                            self.settings_manager.navigate(1)
+                        elif key_code in (KEY_ENTER, KEY_RETURN):
+                            self.settings_manager.start_edit(self)
+                        elif key_code == ord(' '):
+                            res = self.settings_manager.toggle_bool()
+                            if res: self.set_status(res, timeout=3)
+                        elif key_code == CTRL_O:
+                            res = self.settings_manager.save_settings()
+                            self.set_status(res, timeout=3)
+                            # Ask to reload
+                            if self._prompt_for_confirmation("Reload config to apply changes now? (y/n)"):
+                                self.reload_config()
+
+                        elif key_code == KEY_ESC:
+                            self.active_pane = 'editor'
+                    continue
+            
+                if self.active_pane == 'full_screen_explorer':
+                    self._process_explorer_input(key_code, char_input)
+                    continue
+                # -----------------------------------
 
-            if self.active_pane == 'terminal':
-                if key_code == KEY_ESC:
-                    self.active_pane = 'editor'
+                if self.active_pane == 'explorer':
+                    self._process_explorer_input(key_code, char_input)
                     continue
+
+                if self.search_mode:
+                    self._process_search_input(key_code, char_input)
+                    continue
+
+                if self.active_pane == 'terminal':
+                    if key_code == KEY_ESC:
+                        self.active_pane = 'editor'
+                        continue
                 
-                if char_input:
-                    self.terminal.write_input(char_input)
-                elif key_code == KEY_ENTER or key_code == KEY_RETURN:
-                    self.terminal.write_input("\n")
-                elif key_code in (curses.KEY_BACKSPACE, KEY_BACKSPACE, KEY_BACKSPACE2):
-                    self.terminal.write_input("\x7f") # DEL
-                elif key_code == KEY_TAB:
-                    self.terminal.write_input("\t")
-                elif key_code == CTRL_C:
-                    self.terminal.write_input("\x03")
-                elif key_code == curses.KEY_UP: self.terminal.write_input("\x1b[A")
-                elif key_code == curses.KEY_DOWN: self.terminal.write_input("\x1b[B")
-                elif key_code == curses.KEY_RIGHT: self.terminal.write_input("\x1b[C")
-                elif key_code == curses.KEY_LEFT: self.terminal.write_input("\x1b[D")
+                    if char_input:
+                        self.terminal.write_input(char_input)
+                    elif key_code == KEY_ENTER or key_code == KEY_RETURN:
+                        self.terminal.write_input("\n")
+                    elif key_code in (curses.KEY_BACKSPACE, KEY_BACKSPACE, KEY_BACKSPACE2):
+                        self.terminal.write_input("\x7f") # DEL
+                    elif key_code == KEY_TAB:
+                        self.terminal.write_input("\t")
+                    elif key_code == CTRL_C:
+                        self.terminal.write_input("\x03")
+                    elif key_code == curses.KEY_UP: self.terminal.write_input("\x1b[A")
+                    elif key_code == curses.KEY_DOWN: self.terminal.write_input("\x1b[B")
+                    elif key_code == curses.KEY_RIGHT: self.terminal.write_input("\x1b[C")
+                    elif key_code == curses.KEY_LEFT: self.terminal.write_input("\x1b[D")
                 
-                continue
+                    continue
 
-            if self.vim_mode and self.vim_state == 'insert' and key_code == KEY_ESC:
-                self.vim_state = 'normal'
-                continue
+                if self.vim_mode and self.vim_state == 'insert' and key_code == KEY_ESC:
+                    self.vim_state = 'normal'
+                    continue
 
-            if self.vim_mode and self.vim_state != 'insert' and self.active_pane == 'editor':
-                self._process_vim_input(key_code, char_input)
-                continue
+                if self.vim_mode and self.vim_state != 'insert' and self.active_pane == 'editor':
+                    self._process_vim_input(key_code, char_input)
+                    continue
 
-            if key_code in self.plugin_key_bindings:
-                try: self.plugin_key_bindings[key_code](self)
-                except Exception as e: self.set_status(f"Plugin Error: {e}", timeout=5)
-                continue
+                if key_code in self.plugin_key_bindings:
+                    try: self.plugin_key_bindings[key_code](self)
+                    except Exception as e: self.set_status(f"Plugin Error: {e}", timeout=5)
+                    continue
 
-            # Block editing in read-only tabs, but allow navigation/closing
-            if self.current_tab.read_only:
-                if key_code not in (CTRL_X, CTRL_L, curses.KEY_UP, curses.KEY_DOWN,
-                                    curses.KEY_LEFT, curses.KEY_RIGHT, curses.KEY_PPAGE,
-                                    curses.KEY_NPAGE):
-                    self.set_status("This is a read-only buffer.", timeout=2)
+                # Block editing in read-only tabs, but allow navigation/closing
+                if self.current_tab.read_only:
+                    if key_code not in (CTRL_X, CTRL_L, curses.KEY_UP, curses.KEY_DOWN,
+                                        curses.KEY_LEFT, curses.KEY_RIGHT, curses.KEY_PPAGE,
+                                        curses.KEY_NPAGE):
+                        self.set_status("This is a read-only buffer.", timeout=2)
+                        continue
+
+                # 通常の文字入力はキー表の検索や分岐の列をたどらずに先に処理する
+                if char_input is not None:
+                    self._type_text(char_input)
                     continue
 
-            if key_code == CTRL_D:
-                self.show_diff()
-            elif key_code == CTRL_C:
-                self.perform_copy()
-            elif key_code == CTRL_X:
-                # Tab Close Logic
-                if self.close_current_tab():
-                    return
-            elif key_code == CTRL_O: self.save_file()
-            elif key_code == CTRL_W: 
-                self.search_mode = not self.search_mode
-                if self.search_mode:
-                    self.search_input_focused = "search"
-                else:
-                    self.search_results = []
-                    self.active_search_idx = -1
-            elif key_code == CTRL_MARK:
-                if self.mark_pos: 
-                    self.mark_pos = None
-                    self.set_status("Mark Unset", timeout=2)
-                else: 
-                    self.mark_pos = (self.cursor_y, self.cursor_x)
-                    self.set_status("Mark Set", timeout=2)
-            elif key_code == CTRL_G: self.goto_line()
-            elif key_code == CTRL_A: self.select_all()
-            elif key_code == CTRL_Q:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y, 0, update_desired_x=True)
-            elif key_code == CTRL_E: 
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y, len(self.buffer.lines[self.cursor_y]), update_desired_x=True)
-            elif key_code == CTRL_SLASH: self.toggle_comment()
-            elif key_code == CTRL_Y: self.delete_line()
-            elif key_code == CTRL_P: self.enter_command_mode()
-            elif key_code == CTRL_K: self.perform_cut()
-            elif key_code == CTRL_U: self.toggle_relative_linenum()
-            elif key_code == CTRL_Z: self.undo()
-            elif key_code == CTRL_R: self.redo()
-            elif key_code == curses.KEY_UP:
-                if self.suggestion_active:
-                    self.selected_suggestion_idx = (self.selected_suggestion_idx - 1 + len(self.suggestions)) % len(self.suggestions)
-                else:
-                    self.move_cursor(self.cursor_y - 1, self.desired_x)
-            elif key_code == curses.KEY_DOWN:
-                if self.suggestion_active:
-                    self.selected_suggestion_idx = (self.selected_suggestion_idx + 1) % len(self.suggestions)
-                else:
-                    self.move_cursor(self.cursor_y + 1, self.desired_x)
-            elif key_code == curses.KEY_LEFT:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y, self.cursor_x - 1, update_desired_x=True)
-            elif key_code == curses.KEY_RIGHT:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y, self.cursor_x + 1, update_desired_x=True)
-            elif key_code == curses.KEY_HOME:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y, 0, update_desired_x=True)
-            elif key_code == curses.KEY_END:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y, len(self.buffer.lines[self.cursor_y]), update_desired_x=True)
-            elif key_code == curses.KEY_PPAGE:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y - self.get_edit_height(), self.cursor_x, update_desired_x=True)
-            elif key_code == curses.KEY_NPAGE:
-                self.suggestion_active = False
-                self.move_cursor(self.cursor_y + self.get_edit_height(), self.cursor_x, update_desired_x=True)
-            elif key_code in (curses.KEY_BACKSPACE, KEY_BACKSPACE, KEY_BACKSPACE2):
-                if self.mark_pos: self.perform_cut() 
-                elif self.cursor_x > 0:
-                    self.save_history()
+                # 引数なしで呼べるキーは表引きで処理する
+                handler = self._KEY_HANDLERS.get(key_code)
+                if handler is not None:
+                    getattr(self, handler)()
+                    continue
+
+                if key_code == CTRL_X:
+                    # Tab Close Logic
+                    if self.close_current_tab():
+                        return
+                elif key_code in (curses.KEY_BACKSPACE, KEY_BACKSPACE, KEY_BACKSPACE2):
+                    if self.mark_pos: self.perform_cut() 
+                    elif self.cursor_x > 0:
+                        self._push_undo(self.cursor_y, self.cursor_y)
+                        line = self.buffer.lines[self.cursor_y]
+                        self.buffer.lines[self.cursor_y] = line[:self.cursor_x-1] + line[self.cursor_x:]
+                        self.move_cursor(self.cursor_y, self.cursor_x - 1, update_desired_x=True)
+                        self.modified = True
+                    elif self.cursor_y > 0:
+                        self._push_undo(self.cursor_y - 1, self.cursor_y)
+                        prev_len = len(self.buffer.lines[self.cursor_y - 1])
+                        self.buffer.lines[self.cursor_y - 1] = _intern_line(self.buffer.lines[self.cursor_y - 1] + self.buffer.lines[self.cursor_y])
+                        del self.buffer.lines[self.cursor_y]
+                        self._hl_invalidate(self.cursor_y - 1, -1)
+                        self.move_cursor(self.cursor_y - 1, prev_len, update_desired_x=True)
+                        self.modified = True
+                    self._update_suggestions()
+                elif key_code == KEY_ENTER or key_code == KEY_RETURN:
+                    if self.suggestion_active:
+                        self._apply_suggestion()
+                        continue
+                    self.suggestion_active = False
+                    self._push_undo(self.cursor_y, self.cursor_y)
                     line = self.buffer.lines[self.cursor_y]
-                    self.buffer.lines[self.cursor_y] = line[:self.cursor_x-1] + line[self.cursor_x:]
-                    self.move_cursor(self.cursor_y, self.cursor_x - 1, update_desired_x=True)
+                    indent = ""
+                
+                    if self.config.get("auto_indent", True):
+                        # ペースト検知のヒューリスティック：直後に別の入力（バースト）があるか確認
+                        self.stdscr.nodelay(True)
+                        try:
+                            peek = self.stdscr.get_wch()
+                            try: curses.unget_wch(peek)
+                            except curses.error: pass
+                            is_burst = True
+                        except curses.error:
+                            is_burst = False
+                        self.stdscr.nodelay(False)
+
+                        if not is_burst:
+                            # 行頭の空白を正規表現を使わずに切り出す
+                            indent = line[:len(line) - len(line.lstrip())]
+
+                    self.buffer.lines.insert(self.cursor_y + 1, _intern_line(indent + line[self.cursor_x:]))
+                    self.buffer.lines[self.cursor_y] = _intern_line(line[:self.cursor_x])
+                    self._hl_invalidate(self.cursor_y, 1)
+                    self.move_cursor(self.cursor_y + 1, len(indent), update_desired_x=True)
                     self.modified = True
-                elif self.cursor_y > 0:
-                    self.save_history()
-                    prev_len = len(self.buffer.lines[self.cursor_y - 1])
-                    self.buffer.lines[self.cursor_y - 1] += self.buffer.lines[self.cursor_y]
-                    del self.buffer.lines[self.cursor_y]
-                    self.move_cursor(self.cursor_y - 1, prev_len, update_desired_x=True)
+                elif key_code == KEY_TAB:
+                    if self.suggestion_active:
+                        self._apply_suggestion()
+                        continue
+                    self._push_undo(self.cursor_y, self.cursor_y)
+                    tab_spaces = " " * self.config.get("tab_width", 4)
+                    line = self.buffer.lines[self.cursor_y]
+                    self.buffer.lines[self.cursor_y] = line[:self.cursor_x] + tab_spaces + line[self.cursor_x:]
+                    self.move_cursor(self.cursor_y, self.cursor_x + len(tab_spaces), update_desired_x=True)
                     self.modified = True
-                self._update_suggestions()
-            elif key_code == KEY_ENTER or key_code == KEY_RETURN:
-                if self.suggestion_active:
-                    self._apply_suggestion()
-                    continue
-                self.suggestion_active = False
-                self.save_history()
-                line = self.buffer.lines[self.cursor_y]
-                indent = ""
-                
-                if self.config.get("auto_indent", True):
-                    # ペースト検知のヒューリスティック：直後に別の入力（バースト）があるか確認
-                    self.stdscr.nodelay(True)
-                    try:
-                        peek = self.stdscr.get_wch()
-                        try: curses.unget_wch(peek)
-                        except curses.error: pass
-                        is_burst = True
-                    except curses.error:
-                        is_burst = False
-                    self.stdscr.nodelay(False)
-
-                    if not is_burst:
-                        match = re.match(r'^(\s*)', line)
-                        if match:
-                            indent = match.group(1)
-
-                self.buffer.lines.insert(self.cursor_y + 1, indent + line[self.cursor_x:])
-                self.buffer.lines[self.cursor_y] = line[:self.cursor_x]
-                self.move_cursor(self.cursor_y + 1, len(indent), update_desired_x=True)
-                self.modified = True
-            elif key_code == KEY_TAB:
-                if self.suggestion_active:
-                    self._apply_suggestion()
-                    continue
-                self.save_history()
-                tab_spaces = " " * self.config.get("tab_width", 4)
-                line = self.buffer.lines[self.cursor_y]
-                self.buffer.lines[self.cursor_y] = line[:self.cursor_x] + tab_spaces + line[self.cursor_x:]
-                self.move_cursor(self.cursor_y, self.cursor_x + len(tab_spaces), update_desired_x=True)
-                self.modified = True
-            
-            elif char_input:
-                self.save_history()
-                line = self.buffer.lines[self.cursor_y]
-                self.buffer.lines[self.cursor_y] = line[:self.cursor_x] + char_input + line[self.cursor_x:]
-                self.move_cursor(self.cursor_y, self.cursor_x + 1, update_desired_x=True)
-                self.modified = True
-                self._update_suggestions()
+        finally:
+            # Ctrl-X での終了（return）も含め、どの経路で抜けても監視スレッドを止める
+            if self._file_watcher:
+                self._file_watcher.stop()
 
 def main(stdscr, start_time):
-    os.environ.setdefault('ESCDELAY', '25')
     curses.raw()
     # ブラケットペーストモードを有効化
     sys.stdout.write("\x1b[?200h")
@@ -5188,6 +6109,8 @@ def start_app():
         print("Caffee editor is not supported in 'dumb' terminal environments.", file=sys.stderr)
         return
 
+    # ESCDELAY は initscr() の時点で読まれるので curses.wrapper より前に設定する
+    os.environ.setdefault('ESCDELAY', '25')
     try:
         curses.wrapper(main, start_time)
     except curses.error as e: